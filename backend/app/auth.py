@@ -1,6 +1,7 @@
 """JWT auth support"""
 import datetime
-from typing import Annotated
+import hmac
+from typing import Annotated, TypeAlias
 
 import bcrypt
 import fastapi
@@ -8,9 +9,15 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from psycopg import AsyncConnection
 
-from app.config import SECRET_KEY
-from app.db import Connection
-from app.db.user import UserRepository
+from app.config import ADMIN_TOKEN, SECRET_KEY, SHARD_DIRECTORY_TTL
+from app.db import (
+    Repositories,
+    RepositorySet,
+    checkout,
+    primary_connection,
+    shard,
+)
+from app.profiling import profiled
 from app.serializers import TokenData, User, UserInDB
 
 ALGORITHM = "HS256"
@@ -19,28 +26,32 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token")
 
 
+@profiled("bcrypt")
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifies the plaintext password matches the hashed password"""
     return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
 
 
+@profiled("bcrypt")
 def get_password_hash(password: str) -> str:
     """Creates hash from plaintext"""
     return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
 
 
-async def get_user(conn: AsyncConnection, username: str) -> UserInDB | None:
+async def get_user(
+    conn: AsyncConnection, repos: RepositorySet, username: str
+) -> UserInDB | None:
     """Get user from database if username exists"""
-    user_repo = UserRepository(conn)
+    user_repo = repos.user(conn)
     result = await user_repo.get(username)
     return UserInDB(**result) if result else None
 
 
 async def authenticate_user(
-    conn: AsyncConnection, username: str, password: str
+    conn: AsyncConnection, repos: RepositorySet, username: str, password: str
 ) -> UserInDB | None:
     """Authenticate username and password with db"""
-    user = await get_user(conn, username)
+    user = await get_user(conn, repos, username)
     if (
         user is None
         or user.disabled
@@ -68,9 +79,11 @@ def create_access_token(
     return encoded_jwt
 
 
+@profiled("auth")
 async def get_current_user(
+    request: fastapi.Request,
     token: Annotated[str, fastapi.Depends(oauth2_scheme)],
-    conn: Connection,
+    repos: Repositories,
 ) -> UserInDB:
     """Gets and verifies user info from JWT"""
     credentials_exception = fastapi.HTTPException(
@@ -88,7 +101,8 @@ async def get_current_user(
     except JWTError as err:
         raise credentials_exception from err
 
-    user = await get_user(conn, token_data.username)
+    async with primary_connection(request) as conn:
+        user = await get_user(conn, repos, token_data.username)
 
     if user is None:
         raise credentials_exception
@@ -109,3 +123,56 @@ async def get_current_active_user(
 
 
 CurrentActiveUser = Annotated[UserInDB, fastapi.Depends(get_current_active_user)]
+
+
+async def verify_admin_token(
+    x_admin_token: Annotated[str | None, fastapi.Header()] = None
+):
+    """Ensures the request carries the ADMIN_TOKEN of operator routes"""
+    if (
+        not ADMIN_TOKEN
+        or x_admin_token is None
+        or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode())
+    ):
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_403_FORBIDDEN,
+            detail={"message": "Admin token required"},
+        )
+
+
+USER_MOVING = {"message": "The user's data is being moved, try again shortly"}
+
+
+async def get_user_connection(request: fastapi.Request, user: CurrentActiveUser):
+    """
+    Get a connection to the shard holding the current user's transactions and
+    budgets. Writes are refused while the user is being moved between shards. No
+    primary connection is held for the request unless the user lives on it.
+    With the in-memory backend the shared store is yielded instead.
+    """
+    memory_store = getattr(request.app, "memory_store", None)
+    if memory_store is not None:
+        yield memory_store
+        return
+
+    router = shard.shard_router
+    if router is None:
+        async with checkout(request, request.app.conn_pool) as conn:
+            yield conn
+        return
+
+    shard_index, moving = await router.locate(user.id)
+    if moving and request.method not in ("GET", "HEAD"):
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=USER_MOVING,
+            headers={"Retry-After": str(int(SHARD_DIRECTORY_TTL) + 1)},
+        )
+
+    async with checkout(request, router.pools[shard_index]) as conn:
+        yield conn
+
+
+UserConnection: TypeAlias = Annotated[
+    AsyncConnection, fastapi.Depends(get_user_connection)
+]
@@ -0,0 +1,83 @@
+"""Conditional GETs of a user's lists, validated by the user's data version"""
+import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from uuid import UUID
+
+import fastapi
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of the ETag against an If-None-Match header"""
+    if if_none_match.strip() == "*":
+        return True
+
+    opaque_tag = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(",")
+    )
+
+
+def _last_modified(modified: datetime.datetime) -> datetime.datetime:
+    """
+    Round the modified time up to the whole second sent as Last-Modified, as HTTP
+    dates have a resolution of one second. A later change then always has a later
+    date, provided the date is only sent once its second has passed.
+    """
+    if modified.microsecond:
+        modified = modified.replace(microsecond=0) + datetime.timedelta(seconds=1)
+    return modified
+
+
+def _modified_since(if_modified_since: str, last_modified: datetime.datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return True
+
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    return last_modified > since
+
+
+def not_modified(
+    request: fastapi.Request,
+    response: fastapi.Response,
+    user_id: UUID,
+    version: int,
+    modified: datetime.datetime | None,
+) -> fastapi.Response | None:
+    """
+    Set the validators of a user's list on the response. Returns a 304 response
+    when the client's copy is current so the list query can be skipped.
+
+    Read the version before the list. A change committed in between only makes the
+    client fetch the list again.
+    """
+    etag = f'W/"{user_id}.{version}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, no-cache",
+        "Vary": "Authorization",
+    }
+    last_modified = None
+    if modified is not None:
+        last_modified = _last_modified(modified.astimezone(datetime.timezone.utc))
+        # Within its second another change could still get the same date
+        if last_modified <= datetime.datetime.now(datetime.timezone.utc):
+            headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        fresh = _etag_matches(if_none_match, etag)
+    elif if_modified_since is not None and last_modified is not None:
+        fresh = not _modified_since(if_modified_since, last_modified)
+    else:
+        fresh = False
+
+    if fresh:
+        return fastapi.Response(
+            status_code=fastapi.status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+    return None
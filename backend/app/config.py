@@ -15,3 +15,108 @@ POSTGRES_CONNINFO = f"""
     host={SQL_HOST}
     port={SQL_PORT}
 """
+
+# Seconds before the in-process merchant matcher is rebuilt from the database
+MERCHANT_MATCHER_MAX_AGE = float(os.environ.get("MERCHANT_MATCHER_MAX_AGE", "300"))
+
+# Number of users whose category suggestion model is kept in memory, the seconds
+# before a model is reloaded, and the confidence needed to fill in a category
+CATEGORY_MODEL_CACHE_SIZE = int(os.environ.get("CATEGORY_MODEL_CACHE_SIZE", "10000"))
+CATEGORY_MODEL_MAX_AGE = float(os.environ.get("CATEGORY_MODEL_MAX_AGE", "300"))
+CATEGORY_SUGGESTION_MIN_CONFIDENCE = float(
+    os.environ.get("CATEGORY_SUGGESTION_MIN_CONFIDENCE", "0.6")
+)
+
+# Merchant autocomplete results are cached for queries up to this many characters
+MERCHANT_SEARCH_CACHE_PREFIX_LENGTH = int(
+    os.environ.get("MERCHANT_SEARCH_CACHE_PREFIX_LENGTH", "3")
+)
+MERCHANT_SEARCH_CACHE_SIZE = int(os.environ.get("MERCHANT_SEARCH_CACHE_SIZE", "50000"))
+MERCHANT_SEARCH_CACHE_TTL = float(os.environ.get("MERCHANT_SEARCH_CACHE_TTL", "60"))
+
+# Production server. WEB_CONCURRENCY worker processes share a budget of
+# POSTGRES_MAX_CONNECTIONS, less POSTGRES_RESERVED_CONNECTIONS kept free for
+# superusers, migrations and maintenance jobs.
+SERVER_HOST = os.environ.get("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", "8000"))
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+GRACEFUL_SHUTDOWN_TIMEOUT = int(os.environ.get("GRACEFUL_SHUTDOWN_TIMEOUT", "30"))
+POSTGRES_MAX_CONNECTIONS = int(os.environ.get("POSTGRES_MAX_CONNECTIONS", "100"))
+POSTGRES_RESERVED_CONNECTIONS = int(
+    os.environ.get("POSTGRES_RESERVED_CONNECTIONS", "10")
+)
+POSTGRES_POOL_MAX_SIZE = max(
+    1, (POSTGRES_MAX_CONNECTIONS - POSTGRES_RESERVED_CONNECTIONS) // WEB_CONCURRENCY
+)
+POSTGRES_POOL_MIN_SIZE = min(4, POSTGRES_POOL_MAX_SIZE)
+POSTGRES_POOL_WARMUP_TIMEOUT = float(
+    os.environ.get("POSTGRES_POOL_WARMUP_TIMEOUT", "30")
+)
+
+# Conninfo strings of the Postgres shards separated by ";". The first shard is the
+# primary holding users, the shard directory and merchant aliases. Shard
+# directory entries are cached for SHARD_DIRECTORY_TTL seconds.
+POSTGRES_SHARDS = [
+    conninfo
+    for conninfo in os.environ.get("POSTGRES_SHARDS", "").split(";")
+    if conninfo.strip()
+] or [POSTGRES_CONNINFO]
+SHARD_DIRECTORY_TTL = float(os.environ.get("SHARD_DIRECTORY_TTL", "5"))
+SHARD_DIRECTORY_CACHE_SIZE = int(os.environ.get("SHARD_DIRECTORY_CACHE_SIZE", "100000"))
+
+# Default statement timeout and overrides for routes, keyed by "METHOD /path"
+STATEMENT_TIMEOUT_MS = int(os.environ.get("STATEMENT_TIMEOUT_MS", "5000"))
+ROUTE_STATEMENT_TIMEOUTS_MS = {
+    "GET /api/transactions/": 2000,
+    "GET /api/merchants/search": 1000,
+    "POST /api/merchants/match": 30000,
+    "POST /api/transactions/suggest": 30000,
+    "POST /api/transactions/import": 30000,
+}
+
+# Storage behind the repositories, "postgres" or "memory"
+REPOSITORY_BACKEND = os.environ.get("REPOSITORY_BACKEND", "postgres")
+
+# Opt-in request profiling. PROFILING_SAMPLE_RATE of requests, and requests with an
+# X-Admin-Token header matching ADMIN_TOKEN, are profiled into a ring buffer of the
+# last PROFILING_BUFFER_SIZE profiles. The admin routes are closed without a token.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "").lower() in ("1", "true")
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", "0.01"))
+PROFILING_BUFFER_SIZE = int(os.environ.get("PROFILING_BUFFER_SIZE", "500"))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+# Token buckets of routes doing bcrypt work, as (capacity, tokens per second) for
+# each client IP and for each username. Buckets are kept per process, and with
+# RATE_LIMIT_BACKEND "postgres" also shared by every worker through the primary.
+RATE_LIMITS = {
+    "POST /api/token/": {"ip": (20, 0.5), "username": (5, 0.1)},
+    "POST /api/user/": {"ip": (5, 0.05), "username": (3, 0.05)},
+}
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_CACHE_SIZE = int(os.environ.get("RATE_LIMIT_CACHE_SIZE", "100000"))
+
+# Responses of at least GZIP_MINIMUM_SIZE bytes are gzip compressed when accepted
+GZIP_MINIMUM_SIZE = int(os.environ.get("GZIP_MINIMUM_SIZE", "1000"))
+GZIP_COMPRESSLEVEL = int(os.environ.get("GZIP_COMPRESSLEVEL", "5"))
+
+# Transactions dated more than ARCHIVE_AFTER_DAYS ago are moved by the archive job
+# into a file per user under ARCHIVE_DIR, in record batches of ARCHIVE_BATCH_ROWS
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "730"))
+ARCHIVE_BATCH_ROWS = int(os.environ.get("ARCHIVE_BATCH_ROWS", "1024"))
+ARCHIVE_INFO_CACHE_SIZE = int(os.environ.get("ARCHIVE_INFO_CACHE_SIZE", "100000"))
+
+# Opt-in slow query capture. Repository queries slower than SLOW_QUERY_MS, 0 to
+# disable, are captured with their plan into a buffer of the last
+# SLOW_QUERY_BUFFER_SIZE captures, browsed through the admin routes. Read-only
+# statements are explained with ANALYZE, which runs them again, writes without. A
+# statement is explained at most once every SLOW_QUERY_EXPLAIN_INTERVAL seconds and
+# for SLOW_QUERY_EXPLAIN_TIMEOUT_MS, capped at the statement timeout of its route.
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "0"))
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get("SLOW_QUERY_BUFFER_SIZE", "200"))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(
+    os.environ.get("SLOW_QUERY_EXPLAIN_INTERVAL", "300")
+)
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(
+    os.environ.get("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "30000")
+)
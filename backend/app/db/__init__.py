@@ -1,34 +1,283 @@
 """Database related dependencies."""
-from contextlib import asynccontextmanager
-from typing import Annotated, TypeAlias
+import asyncio
+import signal
+import threading
+import weakref
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from typing import Annotated, NamedTuple, TypeAlias
 
 import fastapi
 import psycopg
 import psycopg_pool
+from psycopg import AsyncCursor
+from psycopg.errors import QueryCanceled
+from psycopg.pq import TransactionStatus
 
-from app.config import POSTGRES_CONNINFO
+from app import metrics
+from app.config import (
+    POSTGRES_POOL_MAX_SIZE,
+    POSTGRES_POOL_MIN_SIZE,
+    POSTGRES_POOL_WARMUP_TIMEOUT,
+    POSTGRES_SHARDS,
+    PROFILING_ENABLED,
+    ROUTE_STATEMENT_TIMEOUTS_MS,
+    SLOW_QUERY_MS,
+    STATEMENT_TIMEOUT_MS,
+)
+from app.db import shard
+from app.db.budget import BudgetRepository
+from app.db.category import CategoryRepository
+from app.db.merchant import MerchantRepository
+from app.db.transaction import TransactionRepository
+from app.db.user import UserRepository
+from app.profiling import ProfiledCursor
+from app.slow_queries import (
+    SlowQueryCursor,
+    track_connection,
+    track_statement_timeout,
+)
+
+
+class RepositorySet(NamedTuple):
+    """
+    Repository classes of one storage backend. Each is constructed with the object
+    yielded by get_connection and exposes the same methods across backends.
+    """
+
+    user: type
+    category: type
+    merchant: type
+    transaction: type
+    budget: type
+
+
+POSTGRES_REPOSITORIES = RepositorySet(
+    user=UserRepository,
+    category=CategoryRepository,
+    merchant=MerchantRepository,
+    transaction=TransactionRepository,
+    budget=BudgetRepository,
+)
+
+QUERY_CANCELED = {"message": "The query was canceled or timed out"}
+
+# Connections checked out with a non-default statement_timeout
+_timeout_overrides: weakref.WeakSet = weakref.WeakSet()
+# Connections a cancel request was sent for, which are not reused
+_canceled_connections: weakref.WeakSet = weakref.WeakSet()
+
+
+async def _reset_connection(conn: psycopg.AsyncConnection):
+    """Restore the default statement_timeout before a connection is reused"""
+    if conn in _timeout_overrides:
+        await conn.execute("RESET statement_timeout;")
+        _timeout_overrides.discard(conn)
+        track_statement_timeout(conn, None)
+
+
+def _create_pool(conninfo: str) -> psycopg_pool.AsyncConnectionPool:
+    if PROFILING_ENABLED:
+        cursor_factory = ProfiledCursor
+    elif SLOW_QUERY_MS:
+        cursor_factory = SlowQueryCursor
+    else:
+        cursor_factory = AsyncCursor
+
+    async def configure(conn: psycopg.AsyncConnection):
+        await track_connection(conn, pool)
+
+    pool = psycopg_pool.AsyncConnectionPool(
+        conninfo,
+        min_size=POSTGRES_POOL_MIN_SIZE,
+        max_size=POSTGRES_POOL_MAX_SIZE,
+        kwargs={
+            "autocommit": True,
+            "options": f"-c statement_timeout={STATEMENT_TIMEOUT_MS}",
+            "cursor_factory": cursor_factory,
+        },
+        configure=configure,
+        reset=_reset_connection,
+        open=False,
+    )
+    return pool
+
+
+@contextmanager
+def not_ready_on_shutdown(app: fastapi.FastAPI):
+    """
+    Stop reporting the app ready as soon as the server is told to shut down, before
+    it drains in-flight requests, by chaining the SIGTERM and SIGINT handlers the
+    server installed. Handlers are only installed from the main thread.
+    """
+    app.shutting_down = False
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    previous_handlers = {}
+
+    def handle_exit(sig: int, frame):
+        app.shutting_down = True
+        app.ready = False
+        handler = previous_handlers[sig]
+        if handler == signal.SIG_DFL:
+            signal.signal(sig, handler)
+            signal.raise_signal(sig)
+        elif callable(handler):
+            handler(sig, frame)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous_handlers[sig] = signal.signal(sig, handle_exit)
+    try:
+        yield
+    finally:
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+
+
+async def _warm_up(app: fastapi.FastAPI, pools: list[psycopg_pool.AsyncConnectionPool]):
+    """
+    Report the app ready once every pool holds its minimum number of connections.
+    A pool still short after POSTGRES_POOL_WARMUP_TIMEOUT is closed, so the worker
+    is stopped to be restarted.
+    """
+    try:
+        for pool in pools:
+            await pool.wait(timeout=POSTGRES_POOL_WARMUP_TIMEOUT)
+    except psycopg_pool.PoolTimeout:
+        signal.raise_signal(signal.SIGTERM)
+        return
+
+    app.ready = not app.shutting_down
 
 
 @asynccontextmanager
 async def postgres_pool_lifespan(app: fastapi.FastAPI):
-    """Create and manage connection pool in fastapi lifecycle"""
-    async with psycopg_pool.AsyncConnectionPool(
-        POSTGRES_CONNINFO, kwargs={"autocommit": True}, open=False
-    ) as pool:
-        app.conn_pool = pool
-        yield
+    """
+    Create and manage a connection pool for each shard in fastapi lifecycle.
+    Requests are served while the pools warm up in the background, but the app only
+    reports ready once they are warm and until shutdown begins.
+    """
+    app.ready = False
+    app.repositories = POSTGRES_REPOSITORIES
+    async with AsyncExitStack() as stack:
+        pools = [
+            await stack.enter_async_context(_create_pool(conninfo))
+            for conninfo in POSTGRES_SHARDS
+        ]
+        app.conn_pool = pools[0]
+        if len(pools) > 1:
+            shard.shard_router = shard.ShardRouter(pools)
+
+        with not_ready_on_shutdown(app):
+            warm_up = asyncio.create_task(_warm_up(app, pools))
+            try:
+                yield
+            finally:
+                app.ready = False
+                warm_up.cancel()
+                await asyncio.wait([warm_up])
+                shard.shard_router = None
+
+
+async def _cancel_on_disconnect(
+    request: fastapi.Request, conn: psycopg.AsyncConnection
+):
+    """
+    Wait for the client to disconnect and cancel the query running on its
+    connection. Routes have read their body before dependencies run, so the next
+    message received is the disconnect. Runs only while the request holds the
+    connection, checkout waits for it before releasing the connection.
+    """
+    message = await request.receive()
+    while message["type"] != "http.disconnect":
+        message = await request.receive()
+
+    request.state.client_disconnected = True
+    if conn.info.transaction_status == TransactionStatus.ACTIVE:
+        _canceled_connections.add(conn)
+        await conn.cancel_safe()
+
+
+@asynccontextmanager
+async def checkout(request: fastapi.Request, pool: psycopg_pool.AsyncConnectionPool):
+    """
+    Check out a connection for a request. Statements run with the route's timeout
+    from ROUTE_STATEMENT_TIMEOUTS_MS and are canceled when the client disconnects.
+    """
+    route_name = metrics.route_name(request.scope)
+    timeout = ROUTE_STATEMENT_TIMEOUTS_MS.get(route_name, STATEMENT_TIMEOUT_MS)
+    async with pool.connection() as conn:
+        if timeout != STATEMENT_TIMEOUT_MS:
+            _timeout_overrides.add(conn)
+            track_statement_timeout(conn, timeout)
+            await conn.execute(
+                "SELECT set_config('statement_timeout', %s, false);", (str(timeout),)
+            )
+
+        watcher = asyncio.create_task(_cancel_on_disconnect(request, conn))
+        try:
+            yield conn
+        except QueryCanceled as err:
+            if getattr(request.state, "client_disconnected", False):
+                metrics.client_cancellations[route_name] += 1
+            else:
+                metrics.statement_timeouts[route_name] += 1
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=QUERY_CANCELED,
+            ) from err
+        finally:
+            if conn in _canceled_connections:
+                # The statement may have finished before the cancel arrived, which
+                # would then hit a later statement. Closed connections are
+                # discarded by the pool.
+                await asyncio.wait([watcher])
+                await conn.close()
+            else:
+                watcher.cancel()
+                await asyncio.wait([watcher])
 
 
 async def get_connection(request: fastapi.Request):
     """
-    Get the connection pool from the app instance. The pool itself is provided so
-    transactions can be handled appropriately in the route.
+    Get a connection to the primary database from the app's pool. The connection
+    itself is provided so transactions can be handled appropriately in the route.
+    With the in-memory backend the shared store is yielded instead.
     """
-    conn_pool: psycopg_pool.AsyncConnectionPool = request.app.conn_pool
-    async with conn_pool.connection() as conn:
+    memory_store = getattr(request.app, "memory_store", None)
+    if memory_store is not None:
+        yield memory_store
+        return
+
+    async with checkout(request, request.app.conn_pool) as conn:
         yield conn
 
 
 Connection: TypeAlias = Annotated[
     psycopg.AsyncConnection, fastapi.Depends(get_connection)
 ]
+
+
+@asynccontextmanager
+async def primary_connection(request: fastapi.Request):
+    """
+    Briefly check out a connection to the primary for a lookup, without holding it
+    for the rest of the request. With the in-memory backend the shared store is
+    yielded instead.
+    """
+    memory_store = getattr(request.app, "memory_store", None)
+    if memory_store is not None:
+        yield memory_store
+        return
+
+    async with request.app.conn_pool.connection() as conn:
+        yield conn
+
+
+def get_repositories(request: fastapi.Request) -> RepositorySet:
+    """Get the repository classes of the app's storage backend"""
+    return request.app.repositories
+
+
+Repositories: TypeAlias = Annotated[RepositorySet, fastapi.Depends(get_repositories)]
@@ -0,0 +1,386 @@
+"""
+Cold transaction archive. The archiving job is run with python -m app.db.archive.
+
+Transactions dated more than ARCHIVE_AFTER_DAYS ago are moved out of the hot table
+into one Arrow IPC file per user under ARCHIVE_DIR, compressed with zstd. Rows are
+kept newest first and the schema metadata holds the newest date and the oldest date
+of each record batch, so a page of history only decompresses the batches it
+reaches. Files are memory mapped when read and replaced atomically when written.
+
+Archived transactions are read only. They are listed with the user's other
+transactions and counted in budget history and category suggestions, but can no
+longer be edited or deleted.
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+from pathlib import Path
+from uuid import UUID
+
+import psycopg
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from app.cache import LRUCache
+from app.config import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_ROWS,
+    ARCHIVE_DIR,
+    ARCHIVE_INFO_CACHE_SIZE,
+    POSTGRES_SHARDS,
+)
+
+SCHEMA = pa.schema(
+    [
+        ("id", pa.binary(16)),
+        ("amount", pa.int64()),
+        ("date", pa.date32()),
+        ("merchant_id", pa.binary(16)),
+        ("category_id", pa.binary(16)),
+        ("occurrence", pa.int32()),
+    ]
+)
+_BATCH_OLDEST_KEY = b"batch_oldest"
+_NEWEST_KEY = b"newest"
+# Columns read for aggregates
+_AGGREGATE_SCHEMA = pa.schema(
+    [SCHEMA.field(name) for name in ("amount", "date", "merchant_id", "category_id")]
+)
+_SORT_KEYS = [("date", "descending"), ("id", "descending")]
+
+# (file version, newest archived date) of each user's archive file
+_archive_info = LRUCache(ARCHIVE_INFO_CACHE_SIZE)
+
+
+def _path(user_id: UUID) -> Path:
+    return Path(ARCHIVE_DIR) / f"{user_id}.arrow"
+
+
+def _batch_oldest(reader: pa.ipc.RecordBatchFileReader) -> list[datetime.date]:
+    return [
+        datetime.date.fromisoformat(date)
+        for date in reader.schema.metadata[_BATCH_OLDEST_KEY].decode().split(",")
+    ]
+
+
+def _info(path: Path, cached: tuple | None) -> tuple | None:
+    """
+    Get the version and newest date of an archive file, or None without one. The
+    file is only opened when it changed since cached was read.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if cached is not None and cached[0] == version:
+        return cached
+
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        newest = reader.schema.metadata.get(_NEWEST_KEY)
+        if newest is not None:
+            newest = datetime.date.fromisoformat(newest.decode())
+        elif reader.num_record_batches:
+            # Files written before the newest date was kept
+            newest = reader.get_batch(0)["date"][0].as_py()
+    return version, newest
+
+
+async def _newest(user_id: UUID) -> datetime.date | None:
+    """Get the newest archived date of a user, None without archived rows"""
+    info = await asyncio.to_thread(_info, _path(user_id), _archive_info.get(user_id))
+    if info is None:
+        _archive_info.pop(user_id)
+        return None
+
+    _archive_info.set(user_id, info)
+    return info[1]
+
+
+def _read(
+    path: Path,
+    user_id: UUID,
+    prev_date: datetime.date | None,
+    prev_id: UUID | None,
+    limit: int,
+    reaches: datetime.date | None,
+) -> list[dict]:
+    """
+    Read up to limit archived rows matching the page filters, newest first. Nothing
+    is read when every archived row is older than reaches.
+    """
+    try:
+        source = pa.memory_map(str(path))
+    except FileNotFoundError:
+        return []
+
+    with source:
+        reader = pa.ipc.open_file(source)
+        rows = []
+        for index, oldest in enumerate(_batch_oldest(reader)):
+            if prev_date is not None and oldest >= prev_date:
+                continue
+
+            batch = reader.get_batch(index)
+            if reaches is not None and batch["date"][0].as_py() < reaches:
+                break
+
+            mask = None
+            if prev_date is not None:
+                mask = pc.less(batch["date"], pa.scalar(prev_date, pa.date32()))
+            if prev_id is not None:
+                id_mask = pc.less(batch["id"], pa.scalar(prev_id.bytes, pa.binary(16)))
+                mask = id_mask if mask is None else pc.and_(mask, id_mask)
+            if mask is not None:
+                batch = batch.filter(mask)
+
+            for row in batch.slice(0, limit - len(rows)).to_pylist():
+                rows.append(
+                    {
+                        "id": UUID(bytes=row["id"]),
+                        "amount": row["amount"],
+                        "date": row["date"],
+                        "user_id": user_id,
+                        "merchant_id": UUID(bytes=row["merchant_id"]),
+                        "category_id": UUID(bytes=row["category_id"]),
+                        "occurrence": row.get("occurrence", 1),
+                    }
+                )
+            if len(rows) == limit:
+                break
+
+    return rows
+
+
+async def merge_archived(
+    user_id: UUID,
+    rows: list[dict],
+    prev_date: datetime.date | None,
+    prev_id: UUID | None,
+    limit: int,
+) -> list[dict]:
+    """
+    Merge the user's archived transactions into a page of hot rows ordered by date
+    descending. The archive is only read when the page reaches the newest archived
+    date.
+    """
+    newest = await _newest(user_id)
+    if newest is None:
+        return rows
+
+    # A full page of hot rows has the rows newer than its last date
+    reaches = rows[-1]["date"] if rows and len(rows) == limit else None
+    if reaches is not None and newest < reaches:
+        return rows
+
+    archived = await asyncio.to_thread(
+        _read, _path(user_id), user_id, prev_date, prev_id, limit, reaches
+    )
+    if not archived:
+        return rows
+
+    # Rows are briefly in both places while the archiving job commits
+    hot_ids = {row["id"] for row in rows}
+    merged = rows + [row for row in archived if row["id"] not in hot_ids]
+    merged.sort(key=lambda row: (row["date"], row["id"]), reverse=True)
+    return merged[:limit]
+
+
+def _read_range(
+    path: Path, start: datetime.date | None, stop: datetime.date | None
+) -> pa.Table:
+    """Read the archived rows dated from start until the day before stop"""
+    try:
+        source = pa.memory_map(str(path))
+    except FileNotFoundError:
+        return _AGGREGATE_SCHEMA.empty_table()
+
+    with source:
+        reader = pa.ipc.open_file(source)
+        batches = []
+        for index, oldest in enumerate(_batch_oldest(reader)):
+            if stop is not None and oldest >= stop:
+                continue
+
+            batch = reader.get_batch(index)
+            if start is not None and batch["date"][0].as_py() < start:
+                break
+            batches.append(batch.select(_AGGREGATE_SCHEMA.names))
+
+    table = pa.Table.from_batches(batches, _AGGREGATE_SCHEMA)
+    if start is not None:
+        table = table.filter(
+            pc.greater_equal(table["date"], pa.scalar(start, pa.date32()))
+        )
+    if stop is not None:
+        table = table.filter(pc.less(table["date"], pa.scalar(stop, pa.date32())))
+    return table
+
+
+def _monthly_spending(
+    path: Path, start: datetime.date, stop: datetime.date
+) -> tuple[list, list, list]:
+    table = _read_range(path, start, stop)
+    table = (
+        table.append_column("month", pc.floor_temporal(table["date"], unit="month"))
+        .group_by(["month", "category_id"])
+        .aggregate([("amount", "sum")])
+    )
+    return (
+        table["month"].to_pylist(),
+        [UUID(bytes=value) for value in table["category_id"].to_pylist()],
+        table["amount_sum"].to_pylist(),
+    )
+
+
+def _category_counts(path: Path) -> tuple[list, list, list, list]:
+    table = _read_range(path, None, None)
+    table = table.group_by(["merchant_id", "amount", "category_id"]).aggregate(
+        [([], "count_all")]
+    )
+    return (
+        [UUID(bytes=value) for value in table["merchant_id"].to_pylist()],
+        table["amount"].to_pylist(),
+        [UUID(bytes=value) for value in table["category_id"].to_pylist()],
+        table["count_all"].to_pylist(),
+    )
+
+
+async def archived_spending(
+    user_id: UUID, start: datetime.date, stop: datetime.date
+) -> tuple[list, list, list]:
+    """
+    Get the archived spending of each category for each month from the month
+    starting at start until stop, as columns of month, category ID and amount
+    """
+    newest = await _newest(user_id)
+    if newest is None or newest < start:
+        return [], [], []
+    return await asyncio.to_thread(_monthly_spending, _path(user_id), start, stop)
+
+
+async def archived_category_counts(user_id: UUID) -> tuple[list, list, list, list]:
+    """
+    Count the user's archived transactions by merchant, amount and category, as
+    columns of merchant ID, amount, category ID and count
+    """
+    if await _newest(user_id) is None:
+        return [], [], [], []
+    return await asyncio.to_thread(_category_counts, _path(user_id))
+
+
+def _load(path: Path) -> pa.Table:
+    try:
+        with pa.memory_map(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all().replace_schema_metadata()
+    except FileNotFoundError:
+        return SCHEMA.empty_table()
+
+    # Files written before transactions had an occurrence
+    if "occurrence" not in table.column_names:
+        table = table.append_column(
+            SCHEMA.field("occurrence"), pa.array([1] * len(table), pa.int32())
+        )
+    return table
+
+
+def _write(path: Path, table: pa.Table):
+    """Write the rows newest first in compressed batches, replacing the file"""
+    batches = table.sort_by(_SORT_KEYS).combine_chunks().to_batches(ARCHIVE_BATCH_ROWS)
+    batch_oldest = ",".join(batch["date"][-1].as_py().isoformat() for batch in batches)
+    newest = batches[0]["date"][0].as_py().isoformat()
+    schema = SCHEMA.with_metadata(
+        {_BATCH_OLDEST_KEY: batch_oldest.encode(), _NEWEST_KEY: newest.encode()}
+    )
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            with pa.ipc.new_file(file, schema, options=options) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def archive_user(conn: psycopg.Connection, user_id: UUID, cutoff: datetime.date) -> int:
+    """
+    Move a user's transactions dated before cutoff into their archive file. The
+    rows are deleted once the file is written and their fingerprints are kept so
+    they are not imported again. Returns the number of rows moved.
+    """
+    with conn.transaction():
+        cursor = conn.execute(
+            'SELECT id, amount, "date", merchant_id, category_id, occurrence '
+            'FROM "transaction" WHERE user_id = %s AND "date" < %s FOR UPDATE;',
+            (user_id, cutoff),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+
+        ids, amounts, dates, merchant_ids, category_ids, occurrences = zip(*rows)
+        new = pa.table(
+            [
+                pa.array([row_id.bytes for row_id in ids], pa.binary(16)),
+                pa.array(amounts, pa.int64()),
+                pa.array(dates, pa.date32()),
+                pa.array([merchant_id.bytes for merchant_id in merchant_ids]),
+                pa.array([category_id.bytes for category_id in category_ids]),
+                pa.array(occurrences, pa.int32()),
+            ],
+            schema=SCHEMA,
+        )
+        path = _path(user_id)
+        archived = _load(path)
+        # A rerun after a failed commit finds the rows in both places
+        archived = archived.filter(pc.invert(pc.is_in(archived["id"], new["id"])))
+        _write(path, pa.concat_tables([archived, new]))
+        conn.execute(
+            "INSERT INTO archived_transaction (user_id, fingerprint) "
+            'SELECT user_id, fingerprint FROM "transaction" WHERE id = ANY(%s) '
+            "ON CONFLICT DO NOTHING;",
+            (list(ids),),
+        )
+        conn.execute('DELETE FROM "transaction" WHERE id = ANY(%s);', (list(ids),))
+
+    return len(rows)
+
+
+def archive(conn: psycopg.Connection, cutoff: datetime.date) -> int:
+    """Archive the transactions dated before cutoff of every user on a shard"""
+    cursor = conn.execute(
+        'SELECT DISTINCT user_id FROM "transaction" WHERE "date" < %s;', (cutoff,)
+    )
+    return sum(archive_user(conn, user_id, cutoff) for (user_id,) in cursor.fetchall())
+
+
+def main():
+    """Parse the command line and archive every shard"""
+    parser = argparse.ArgumentParser(description="Archive old transactions")
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=ARCHIVE_AFTER_DAYS,
+        help="archive transactions dated more than this many days ago",
+    )
+    args = parser.parse_args()
+
+    cutoff = datetime.date.today() - datetime.timedelta(days=args.days)
+    for shard, conninfo in enumerate(POSTGRES_SHARDS):
+        with psycopg.connect(conninfo, autocommit=True) as conn:
+            print(f"shard {shard}: archived {archive(conn, cutoff)} transactions")
+
+
+if __name__ == "__main__":
+    main()
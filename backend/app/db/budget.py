@@ -1,5 +1,5 @@
 """Budget repository"""
-from decimal import Decimal
+import datetime
 from uuid import UUID
 
 import fastapi
@@ -7,7 +7,16 @@ from psycopg import AsyncConnection
 from psycopg.errors import IntegrityError
 from psycopg.rows import dict_row
 
+from app.db.archive import archived_spending
+from app.db.data_version import bump_data_version, get_data_version
+
 BUDGET_404 = {"message": "No budget item could be found with the provided ID"}
+BUDGET_PERIOD_ENDED = {
+    "message": "effective must be before the end of the budget period, "
+    "update the period including it instead"
+}
+
+_COLUMNS = 'id, amount, category_id, lower(period) AS start, upper(period) AS "end"'
 
 
 class BudgetRepository:
@@ -18,11 +27,8 @@ class BudgetRepository:
 
     async def get(self, budget_id: UUID, user_id: UUID) -> dict:
         """Get specific budget owned by the given user"""
-        sql = (
-            "SELECT id, amount, category_id FROM budget "
-            "WHERE id = %s AND user_id = %s;"
-        )
-        async with self.conn.cursor(row_factory=dict_row) as cursor:
+        sql = f"SELECT {_COLUMNS} FROM budget WHERE id = %s AND user_id = %s;"
+        async with self.conn.cursor(row_factory=dict_row, binary=True) as cursor:
             await cursor.execute(sql, (budget_id, user_id))
             result = await cursor.fetchone()
 
@@ -33,29 +39,112 @@ class BudgetRepository:
 
         return result
 
-    async def list(self, user_id: UUID) -> list[dict]:
-        """Get all budgets owned by the given user"""
-        sql = "SELECT id, amount, category_id FROM budget WHERE user_id = %s;"
-        async with self.conn.cursor(row_factory=dict_row) as cursor:
-            await cursor.execute(sql, (user_id,))
+    async def get_data_version(
+        self, user_id: UUID
+    ) -> tuple[int, datetime.datetime | None]:
+        """Get the version of the user's transactions and budgets"""
+        return await get_data_version(self.conn, user_id)
+
+    async def history(
+        self, user_id: UUID, start: datetime.date, stop: datetime.date
+    ) -> list[dict]:
+        """
+        Get the budgeted and spent amount of each category for each month from the
+        month starting at start until stop, the first day of a later month. The
+        budget of a month is the last period starting before the month ends.
+        Archived transactions are included in the spent amounts.
+        """
+        sql = (
+            "WITH months AS ("
+            "  SELECT m::date AS month, (m + interval '1 month')::date AS next_month "
+            "  FROM generate_series("
+            "    %(start)s::date, %(stop)s::date - 1, interval '1 month'"
+            "  ) AS m"
+            "), budgeted AS ("
+            "  SELECT DISTINCT ON (m.month, b.category_id) "
+            "    m.month, b.category_id, b.amount "
+            "  FROM budget b "
+            "  JOIN months m ON b.period && daterange(m.month, m.next_month) "
+            "  WHERE b.user_id = %(user_id)s "
+            "    AND b.period && daterange(%(start)s, %(stop)s) "
+            "  ORDER BY m.month, b.category_id, lower(b.period) DESC NULLS LAST"
+            "), spent AS ("
+            "  SELECT month, category_id, sum(amount)::bigint AS spent "
+            "  FROM ("
+            "    SELECT date_trunc('month', \"date\")::date, category_id, amount "
+            '    FROM "transaction" '
+            "    WHERE user_id = %(user_id)s "
+            '      AND "date" >= %(start)s AND "date" < %(stop)s '
+            "    UNION ALL "
+            "    SELECT * FROM unnest("
+            "      %(archived_months)s::date[], %(archived_category_ids)s::uuid[], "
+            "      %(archived_amounts)s::bigint[]"
+            "    )"
+            "  ) AS s(month, category_id, amount) "
+            "  GROUP BY 1, 2"
+            ") "
+            "SELECT month, category_id, b.amount AS budgeted, "
+            "  coalesce(s.spent, 0) AS spent "
+            "FROM budgeted b FULL JOIN spent s USING (month, category_id) "
+            "ORDER BY month, category_id;"
+        )
+        months, category_ids, amounts = await archived_spending(user_id, start, stop)
+        params = {
+            "user_id": user_id,
+            "start": start,
+            "stop": stop,
+            "archived_months": months,
+            "archived_category_ids": category_ids,
+            "archived_amounts": amounts,
+        }
+        async with self.conn.cursor(row_factory=dict_row, binary=True) as cursor:
+            await cursor.execute(sql, params)
             return await cursor.fetchall()
 
-    async def create(self, amount: Decimal, category_id: UUID, user_id: UUID) -> UUID:
-        """Create new budget"""
+    async def list(self, user_id: UUID, on: datetime.date | None = None) -> list[dict]:
+        """Get all budget periods owned by the given user, or those including on"""
+        conditions = ["user_id = %s"]
+        params: list = [user_id]
+        if on:
+            conditions.append("period @> %s::date")
+            params.append(on)
+
+        where_clause = " AND ".join(conditions)
         sql = (
-            "INSERT INTO budget (amount, category_id, user_id) "
-            "VALUES (%(amount)s, %(category_id)s, %(user_id)s) "
+            f"SELECT {_COLUMNS} FROM budget WHERE {where_clause} "
+            "ORDER BY category_id, lower(period) NULLS FIRST;"
+        )
+        async with self.conn.cursor(row_factory=dict_row, binary=True) as cursor:
+            await cursor.execute(sql, params)
+            return await cursor.fetchall()
+
+    async def create(
+        self,
+        amount: int,
+        category_id: UUID,
+        user_id: UUID,
+        start: datetime.date | None,
+        end: datetime.date | None = None,
+    ) -> UUID:
+        """Create new budget for the period from start until the day before end"""
+        sql = (
+            "INSERT INTO budget (amount, category_id, user_id, period) "
+            "VALUES (%(amount)s, %(category_id)s, %(user_id)s, "
+            "daterange(%(start)s, %(end)s)) "
             "RETURNING id;"
         )
         params = {
             "amount": amount,
             "category_id": category_id,
             "user_id": user_id,
+            "start": start,
+            "end": end,
         }
         try:
             async with self.conn.transaction(), self.conn.cursor() as cursor:
                 await cursor.execute(sql, params)
                 result = await cursor.fetchone()
+                await bump_data_version(cursor, user_id)
                 return result[0]
         except IntegrityError as err:
             raise fastapi.HTTPException(
@@ -63,38 +152,75 @@ class BudgetRepository:
                 detail={"message": str(err)},
             )
 
-    async def update(self, amount: Decimal, budget_id: UUID, user_id: UUID):
-        """Update a budget owned by the given user"""
-        sql = (
-            "UPDATE budget SET amount = %(amount)s "
-            "WHERE id = %(id)s AND user_id = %(user_id)s;"
+    async def update(
+        self,
+        amount: int,
+        budget_id: UUID,
+        user_id: UUID,
+        effective: datetime.date,
+    ):
+        """
+        Change the amount of a budget owned by the given user from effective on. A
+        period that started before effective is split so the old amount is kept
+        for the time before it. A period ending before effective is refused.
+        """
+        select_sql = (
+            "SELECT amount, category_id, lower(period), upper(period) FROM budget "
+            "WHERE id = %s AND user_id = %s FOR UPDATE;"
         )
-        params = {
-            "id": budget_id,
-            "amount": amount,
-            "user_id": user_id,
-        }
+        shrink_sql = (
+            "UPDATE budget SET amount = %(amount)s, "
+            "period = daterange(%(effective)s, upper(period)) "
+            "WHERE id = %(id)s;"
+        )
+        history_sql = (
+            "INSERT INTO budget (amount, category_id, user_id, period) "
+            "VALUES (%s, %s, %s, daterange(%s, %s));"
+        )
+        update_sql = "UPDATE budget SET amount = %(amount)s WHERE id = %(id)s;"
+        params = {"id": budget_id, "amount": amount, "effective": effective}
         try:
             async with self.conn.transaction(), self.conn.cursor() as cursor:
-                await cursor.execute(sql, params)
-                not_found = cursor.rowcount == 0
+                await cursor.execute(select_sql, (budget_id, user_id))
+                result = await cursor.fetchone()
+                end = result[3] if result is not None else None
+                if end is not None and effective >= end:
+                    raise fastapi.HTTPException(
+                        status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail=BUDGET_PERIOD_ENDED,
+                    )
+
+                if result is not None and result[0] != amount:
+                    old_amount, category_id, start, _ = result
+                    if start is None or start < effective:
+                        # Shrink before inserting so the periods never overlap
+                        await cursor.execute(shrink_sql, params)
+                        await cursor.execute(
+                            history_sql,
+                            (old_amount, category_id, user_id, start, effective),
+                        )
+                    else:
+                        await cursor.execute(update_sql, params)
+                    await bump_data_version(cursor, user_id)
         except IntegrityError as err:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_409_CONFLICT,
                 detail={"message": str(err)},
             ) from err
 
-        if not_found:
+        if result is None:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_404_NOT_FOUND, detail=BUDGET_404
             )
 
     async def delete(self, budget_id: UUID, user_id: UUID):
-        """Delete a budget owned by the given user"""
+        """Delete a budget period owned by the given user"""
         sql = "DELETE FROM budget WHERE id = %s AND user_id = %s;"
         async with self.conn.transaction(), self.conn.cursor() as cursor:
             await cursor.execute(sql, (budget_id, user_id))
             not_found = cursor.rowcount == 0
+            if not not_found:
+                await bump_data_version(cursor, user_id)
 
         if not_found:
             raise fastapi.HTTPException(
@@ -6,6 +6,8 @@ from psycopg import AsyncConnection
 from psycopg.errors import IntegrityError
 from psycopg.rows import dict_row
 
+from app.db.shard import replication
+
 CATEGORY_404 = {"message": "No category could be found with the provided ID"}
 
 
@@ -38,12 +40,16 @@ class CategoryRepository:
 
     async def create(self, name: str) -> UUID:
         """Create new category"""
-        sql = "INSERT INTO category (name) VALUES (%s) RETURNING id;"
+        sql = "INSERT INTO category (name) VALUES (%s) RETURNING *;"
         try:
-            async with self.conn.transaction(), self.conn.cursor() as cursor:
-                await cursor.execute(sql, (name,))
-                result = await cursor.fetchone()
-                return result[0]
+            async with replication() as replicas:
+                async with self.conn.transaction(), self.conn.cursor(
+                    row_factory=dict_row
+                ) as cursor:
+                    await cursor.execute(sql, (name,))
+                    result = await cursor.fetchone()
+                    await replicas.replicate("category", result)
+                    return result["id"]
         except IntegrityError as err:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_409_CONFLICT,
@@ -52,12 +58,18 @@ class CategoryRepository:
 
     async def update(self, name: str, category_id: UUID):
         """Update a category"""
-        sql = "UPDATE category SET name = %s WHERE id = %s;"
+        sql = "UPDATE category SET name = %s WHERE id = %s RETURNING *;"
 
         try:
-            async with self.conn.transaction(), self.conn.cursor() as cursor:
-                await cursor.execute(sql, (name, category_id))
-                not_found = cursor.rowcount == 0
+            async with replication() as replicas:
+                async with self.conn.transaction(), self.conn.cursor(
+                    row_factory=dict_row
+                ) as cursor:
+                    await cursor.execute(sql, (name, category_id))
+                    result = await cursor.fetchone()
+                    not_found = result is None
+                    if not not_found:
+                        await replicas.replicate("category", result)
         except IntegrityError as err:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_409_CONFLICT,
@@ -72,9 +84,18 @@ class CategoryRepository:
     async def delete(self, category_id: UUID):
         """Delete a category"""
         sql = "DELETE FROM category WHERE id = %s;"
-        async with self.conn.transaction(), self.conn.cursor() as cursor:
-            await cursor.execute(sql, (category_id,))
-            not_found = cursor.rowcount == 0
+        try:
+            async with replication() as replicas:
+                async with self.conn.transaction(), self.conn.cursor() as cursor:
+                    await cursor.execute(sql, (category_id,))
+                    not_found = cursor.rowcount == 0
+                    if not not_found:
+                        await replicas.replicate_delete("category", category_id)
+        except IntegrityError as err:
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_409_CONFLICT,
+                detail={"message": str(err)},
+            ) from err
 
         if not_found:
             raise fastapi.HTTPException(
@@ -0,0 +1,31 @@
+"""
+Per-user data version, bumped by every change to a user's transactions or budgets.
+It backs the conditional GETs of the user's lists.
+"""
+import datetime
+from uuid import UUID
+
+from psycopg import AsyncConnection, AsyncCursor
+
+_BUMP_SQL = (
+    "INSERT INTO user_data_version AS v (user_id, version, modified) "
+    "VALUES (%s, 1, now()) "
+    "ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1, modified = now();"
+)
+
+
+async def bump_data_version(cursor: AsyncCursor, user_id: UUID):
+    """Bump the user's data version. Call it in the transaction making the change."""
+    await cursor.execute(_BUMP_SQL, (user_id,))
+
+
+async def get_data_version(
+    conn: AsyncConnection, user_id: UUID
+) -> tuple[int, datetime.datetime | None]:
+    """Get the user's data version and when it last changed, 0 before any change"""
+    cursor = await conn.execute(
+        "SELECT version, modified FROM user_data_version WHERE user_id = %s;",
+        (user_id,),
+    )
+    row = await cursor.fetchone()
+    return (row[0], row[1]) if row else (0, None)
@@ -0,0 +1,694 @@
+"""
+In-memory repositories. They keep the same interface as the Postgres repositories
+so the API can be load tested and profiled without a database.
+"""
+import bisect
+import datetime
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+from uuid import UUID
+
+import fastapi
+
+from app.db import RepositorySet, not_ready_on_shutdown
+from app.db.budget import BUDGET_404, BUDGET_PERIOD_ENDED
+from app.db.category import CATEGORY_404
+from app.db.merchant import MERCHANT_404
+from app.db.transaction import DUPLICATE_TRANSACTION, TRANSACTION_404
+from app.db.user import USER_404
+from app.matcher import MerchantMatcher
+from app.suggest import CategoryModel
+
+
+def _not_found(detail: dict) -> fastapi.HTTPException:
+    return fastapi.HTTPException(
+        status_code=fastapi.status.HTTP_404_NOT_FOUND, detail=detail
+    )
+
+
+def _conflict(message: str) -> fastapi.HTTPException:
+    return fastapi.HTTPException(
+        status_code=fastapi.status.HTTP_409_CONFLICT, detail={"message": message}
+    )
+
+
+class MemoryStore:
+    """Rows held in dicts with the indexes the repositories query by"""
+
+    def __init__(self):
+        self.users: dict[str, dict] = {}
+        self.user_emails: set[str] = set()
+        self.categories: dict[UUID, dict] = {}
+        self.category_names: dict[str, UUID] = {}
+        self.merchants: dict[UUID, dict] = {}
+        self.merchant_names: dict[str, UUID] = {}
+        # Aliases by (user_id, pattern)
+        self.merchant_aliases: dict[tuple[UUID, str], dict] = {}
+        self.transactions: dict[UUID, dict] = {}
+        # (date, id) of each user's transactions in ascending order
+        self.user_transactions: dict[UUID, list[tuple[datetime.date, UUID]]] = {}
+        # (user_id, date, amount, merchant_id, occurrence) of every transaction
+        self.transaction_fingerprints: set[tuple] = set()
+        self.budgets: dict[UUID, dict] = {}
+        self.user_budgets: dict[UUID, dict[UUID, dict]] = {}
+        self.data_versions: dict[UUID, tuple[int, datetime.datetime]] = {}
+        self.matcher = MerchantMatcher()
+        self.matcher.load([], [])
+        self.category_models: dict[UUID, CategoryModel] = {}
+
+    def bump_data_version(self, user_id: UUID):
+        """Bump the version of a user's transactions and budgets"""
+        version, _ = self.data_versions.get(user_id, (0, None))
+        self.data_versions[user_id] = (
+            version + 1,
+            datetime.datetime.now(datetime.timezone.utc),
+        )
+
+    def category_model(self, user_id: UUID) -> CategoryModel:
+        """Get the always current category model of a user"""
+        model = self.category_models.get(user_id)
+        if model is None:
+            model = self.category_models[user_id] = CategoryModel()
+        return model
+
+
+@asynccontextmanager
+async def memory_lifespan(app: fastapi.FastAPI):
+    """Create an empty in-memory store for the lifetime of the app"""
+    app.memory_store = MemoryStore()
+    app.repositories = MEMORY_REPOSITORIES
+    with not_ready_on_shutdown(app):
+        app.ready = True
+        try:
+            yield
+        finally:
+            app.ready = False
+
+
+class MemoryUserRepository:
+    """In-memory user repository"""
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def get(self, username: str) -> dict:
+        """Get a specific user"""
+        return self.store.users.get(username)
+
+    async def create(self, username: str, email: str, hashed_password: str):
+        """Create new user"""
+        if username in self.store.users:
+            raise _conflict("username already exists")
+        if email is not None and email in self.store.user_emails:
+            raise _conflict("email already exists")
+
+        self.store.users[username] = {
+            "id": uuid.uuid4(),
+            "username": username,
+            "email": email,
+            "hashed_password": hashed_password,
+            "disabled": False,
+        }
+        if email is not None:
+            self.store.user_emails.add(email)
+
+    async def update(self, username: str, hashed_password: str):
+        """Update a user"""
+        user = self.store.users.get(username)
+        if user is None:
+            raise _not_found(USER_404)
+        user["hashed_password"] = hashed_password
+
+    async def delete(self, username: str):
+        """Delete a user"""
+        user = self.store.users.get(username)
+        if user is None or user["disabled"]:
+            raise _not_found(USER_404)
+        user["disabled"] = True
+
+
+class MemoryCategoryRepository:
+    """In-memory category repository"""
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def get(self, category_id: UUID) -> tuple:
+        """Get a specific category"""
+        category = self.store.categories.get(category_id)
+        if category is None:
+            raise _not_found(CATEGORY_404)
+        return category["id"], category["name"]
+
+    async def list(self) -> list[dict]:
+        """Get all categories"""
+        return list(self.store.categories.values())
+
+    async def create(self, name: str) -> UUID:
+        """Create new category"""
+        if name in self.store.category_names:
+            raise _conflict("category name already exists")
+
+        category_id = uuid.uuid4()
+        self.store.categories[category_id] = {"id": category_id, "name": name}
+        self.store.category_names[name] = category_id
+        return category_id
+
+    async def update(self, name: str, category_id: UUID):
+        """Update a category"""
+        category = self.store.categories.get(category_id)
+        if category is None:
+            raise _not_found(CATEGORY_404)
+        if self.store.category_names.get(name, category_id) != category_id:
+            raise _conflict("category name already exists")
+
+        del self.store.category_names[category["name"]]
+        self.store.category_names[name] = category_id
+        category["name"] = name
+
+    async def delete(self, category_id: UUID):
+        """Delete a category"""
+        category = self.store.categories.pop(category_id, None)
+        if category is None:
+            raise _not_found(CATEGORY_404)
+        del self.store.category_names[category["name"]]
+
+
+class MemoryMerchantRepository:
+    """In-memory merchant repository"""
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    async def get(self, merchant_id: UUID) -> tuple:
+        """Get a specific merchant"""
+        merchant = self.store.merchants.get(merchant_id)
+        if merchant is None:
+            raise _not_found(MERCHANT_404)
+        return merchant["id"], merchant["name"]
+
+    async def search(self, query: str, user_id: UUID, limit: int = 10) -> list[dict]:
+        """Search merchants by name, prefix matches and the user's merchants first"""
+        query = query.strip().lower()
+        uses = self.store.category_model(user_id).merchants
+        matches = [
+            (
+                not merchant["name"].lower().startswith(query),
+                -uses.get(merchant["id"], Counter()).total(),
+                merchant["name"],
+                merchant,
+            )
+            for merchant in self.store.merchants.values()
+            if query in merchant["name"].lower()
+        ]
+        matches.sort(key=lambda match: match[:3])
+        return [match[3] for match in matches[:limit]]
+
+    async def list(self) -> list[dict]:
+        """Get all merchants"""
+        return list(self.store.merchants.values())
+
+    async def create(self, name: str) -> UUID:
+        """Create new merchant"""
+        if name in self.store.merchant_names:
+            raise _conflict("merchant name already exists")
+
+        merchant_id = uuid.uuid4()
+        self.store.merchants[merchant_id] = {"id": merchant_id, "name": name}
+        self.store.merchant_names[name] = merchant_id
+        self.store.matcher.set_name(merchant_id, name)
+        return merchant_id
+
+    async def update(self, name: str, merchant_id: UUID):
+        """Update a merchant"""
+        merchant = self.store.merchants.get(merchant_id)
+        if merchant is None:
+            raise _not_found(MERCHANT_404)
+        if self.store.merchant_names.get(name, merchant_id) != merchant_id:
+            raise _conflict("merchant name already exists")
+
+        del self.store.merchant_names[merchant["name"]]
+        self.store.merchant_names[name] = merchant_id
+        merchant["name"] = name
+        self.store.matcher.set_name(merchant_id, name)
+
+    async def delete(self, merchant_id: UUID):
+        """Delete a merchant"""
+        merchant = self.store.merchants.pop(merchant_id, None)
+        if merchant is None:
+            raise _not_found(MERCHANT_404)
+
+        del self.store.merchant_names[merchant["name"]]
+        for key, alias in list(self.store.merchant_aliases.items()):
+            if alias["merchant_id"] == merchant_id:
+                del self.store.merchant_aliases[key]
+        self.store.matcher.remove(merchant_id)
+
+    async def create_alias(
+        self, pattern: str, merchant_id: UUID, user_id: UUID
+    ) -> UUID:
+        """Create new alias pattern for a merchant matching for a user"""
+        if (user_id, pattern) in self.store.merchant_aliases:
+            raise _conflict("alias pattern already exists")
+        if merchant_id not in self.store.merchants:
+            raise _conflict("merchant does not exist")
+
+        alias_id = uuid.uuid4()
+        self.store.merchant_aliases[user_id, pattern] = {
+            "id": alias_id,
+            "pattern": pattern,
+            "merchant_id": merchant_id,
+            "user_id": user_id,
+        }
+        self.store.matcher.add_alias(merchant_id, pattern, user_id)
+        return alias_id
+
+    async def get_matcher(self) -> MerchantMatcher:
+        """Get the descriptor matcher, which is always current"""
+        return self.store.matcher
+
+
+class MemoryTransactionRepository:
+    """In-memory transaction repository"""
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    def _get_owned(self, transaction_id: UUID, user_id: UUID) -> dict:
+        transaction = self.store.transactions.get(transaction_id)
+        if transaction is None or transaction["user_id"] != user_id:
+            raise _not_found(TRANSACTION_404)
+        return transaction
+
+    def _check_references(self, merchant_id: UUID, category_id: UUID):
+        if merchant_id not in self.store.merchants:
+            raise _conflict("merchant does not exist")
+        if category_id not in self.store.categories:
+            raise _conflict("category does not exist")
+
+    def _record_category(self, transaction: dict, count: int):
+        self.store.category_model(transaction["user_id"]).add(
+            transaction["merchant_id"],
+            self.store.merchants[transaction["merchant_id"]]["name"],
+            transaction["amount"],
+            transaction["category_id"],
+            count,
+        )
+
+    async def get(self, transaction_id: UUID, user_id: UUID) -> tuple:
+        """Get a specific transaction"""
+        transaction = self._get_owned(transaction_id, user_id)
+        return tuple(transaction.values())
+
+    def _insert(
+        self,
+        amount: int,
+        date: datetime.date,
+        merchant_id: UUID,
+        category_id: UUID,
+        user_id: UUID,
+        occurrence: int,
+    ) -> UUID | None:
+        fingerprint = _fingerprint(user_id, date, amount, merchant_id, occurrence)
+        if fingerprint in self.store.transaction_fingerprints:
+            return None
+
+        transaction_id = uuid.uuid4()
+        transaction = {
+            "id": transaction_id,
+            "amount": amount,
+            "date": date,
+            "user_id": user_id,
+            "merchant_id": merchant_id,
+            "category_id": category_id,
+            "occurrence": occurrence,
+        }
+        self.store.transactions[transaction_id] = transaction
+        self.store.transaction_fingerprints.add(fingerprint)
+        bisect.insort(
+            self.store.user_transactions.setdefault(user_id, []),
+            (date, transaction_id),
+        )
+        self._record_category(transaction, 1)
+        return transaction_id
+
+    async def create(
+        self,
+        amount: int,
+        date: datetime.date,
+        merchant_id: UUID,
+        category_id: UUID,
+        user_id: UUID,
+        occurrence: int = 1,
+    ) -> UUID:
+        """Create new transaction unless an equal one exists"""
+        self._check_references(merchant_id, category_id)
+        transaction_id = self._insert(
+            amount, date, merchant_id, category_id, user_id, occurrence
+        )
+        if transaction_id is None:
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_409_CONFLICT,
+                detail=DUPLICATE_TRANSACTION,
+            )
+
+        self.store.bump_data_version(user_id)
+        return transaction_id
+
+    async def create_many(
+        self, transactions: list[dict], user_id: UUID
+    ) -> list[UUID | None]:
+        """
+        Create transactions, skipping those equal to an existing one. Returns the ID
+        of each created transaction and None for skipped ones.
+        """
+        for row in transactions:
+            self._check_references(row["merchant_id"], row["category_id"])
+
+        transaction_ids = [
+            self._insert(
+                row["amount"],
+                row["date"],
+                row["merchant_id"],
+                row["category_id"],
+                user_id,
+                row["occurrence"],
+            )
+            for row in transactions
+        ]
+        if any(transaction_ids):
+            self.store.bump_data_version(user_id)
+        return transaction_ids
+
+    async def list(
+        self,
+        user_id: UUID,
+        prev_date: datetime.date | None = None,
+        prev_id: UUID | None = None,
+        limit: int = 50,
+    ) -> list[dict]:
+        """Get a page of the user's transactions, newest first"""
+        keys = self.store.user_transactions.get(user_id, [])
+        end = len(keys) if prev_date is None else bisect.bisect_left(keys, (prev_date,))
+        result = []
+        for index in range(end - 1, -1, -1):
+            if len(result) == limit:
+                break
+            transaction_id = keys[index][1]
+            if prev_id is None or transaction_id < prev_id:
+                result.append(self.store.transactions[transaction_id])
+        return result
+
+    async def update(
+        self,
+        transaction_id: UUID,
+        amount: int,
+        date: datetime.date,
+        merchant_id: UUID,
+        category_id: UUID,
+        user_id: UUID,
+        occurrence: int | None = None,
+    ):
+        """Update a transaction. Its occurrence is kept unless given."""
+        transaction = self._get_owned(transaction_id, user_id)
+        self._check_references(merchant_id, category_id)
+        occurrence = occurrence or transaction["occurrence"]
+        old_fingerprint = _fingerprint(
+            user_id,
+            transaction["date"],
+            transaction["amount"],
+            transaction["merchant_id"],
+            transaction["occurrence"],
+        )
+        fingerprint = _fingerprint(user_id, date, amount, merchant_id, occurrence)
+        if (
+            fingerprint != old_fingerprint
+            and fingerprint in self.store.transaction_fingerprints
+        ):
+            raise _conflict("an equal transaction already exists")
+
+        self.store.transaction_fingerprints.discard(old_fingerprint)
+        self.store.transaction_fingerprints.add(fingerprint)
+        self._record_category(transaction, -1)
+        if transaction["date"] != date:
+            keys = self.store.user_transactions[user_id]
+            keys.remove((transaction["date"], transaction_id))
+            bisect.insort(keys, (date, transaction_id))
+
+        transaction.update(
+            amount=amount,
+            date=date,
+            merchant_id=merchant_id,
+            category_id=category_id,
+            occurrence=occurrence,
+        )
+        self._record_category(transaction, 1)
+        self.store.bump_data_version(user_id)
+
+    async def delete(self, transaction_id: UUID, user_id: UUID):
+        """Delete a transaction"""
+        transaction = self._get_owned(transaction_id, user_id)
+        del self.store.transactions[transaction_id]
+        self.store.transaction_fingerprints.discard(
+            _fingerprint(
+                user_id,
+                transaction["date"],
+                transaction["amount"],
+                transaction["merchant_id"],
+                transaction["occurrence"],
+            )
+        )
+        self.store.user_transactions[user_id].remove(
+            (transaction["date"], transaction_id)
+        )
+        self._record_category(transaction, -1)
+        self.store.bump_data_version(user_id)
+
+    async def get_data_version(
+        self, user_id: UUID
+    ) -> tuple[int, datetime.datetime | None]:
+        """Get the version of the user's transactions and budgets"""
+        return self.store.data_versions.get(user_id, (0, None))
+
+    async def get_category_model(self, user_id: UUID) -> CategoryModel:
+        """Get the category suggestion model for the given user"""
+        return self.store.category_model(user_id)
+
+
+class MemoryBudgetRepository:
+    """In-memory budget repository"""
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    def _get_owned(self, budget_id: UUID, user_id: UUID) -> dict:
+        budget = self.store.user_budgets.get(user_id, {}).get(budget_id)
+        if budget is None:
+            raise _not_found(BUDGET_404)
+        return budget
+
+    def _check_overlap(
+        self,
+        user_id: UUID,
+        category_id: UUID,
+        start: datetime.date | None,
+        end: datetime.date | None,
+        ignore: UUID | None = None,
+    ):
+        for budget in self.store.user_budgets.get(user_id, {}).values():
+            if (
+                budget["id"] != ignore
+                and budget["category_id"] == category_id
+                and _overlaps(budget["start"], budget["end"], start, end)
+            ):
+                raise _conflict("the budget period overlaps another budget period")
+
+    async def get(self, budget_id: UUID, user_id: UUID) -> dict:
+        """Get specific budget owned by the given user"""
+        budget = self._get_owned(budget_id, user_id)
+        return {
+            key: budget[key] for key in ("id", "amount", "category_id", "start", "end")
+        }
+
+    async def get_data_version(
+        self, user_id: UUID
+    ) -> tuple[int, datetime.datetime | None]:
+        """Get the version of the user's transactions and budgets"""
+        return self.store.data_versions.get(user_id, (0, None))
+
+    async def history(
+        self, user_id: UUID, start: datetime.date, stop: datetime.date
+    ) -> list[dict]:
+        """
+        Get the budgeted and spent amount of each category for each month from the
+        month starting at start until stop, the first day of a later month
+        """
+        budgets = self.store.user_budgets.get(user_id, {}).values()
+        keys = self.store.user_transactions.get(user_id, [])
+        rows: dict[tuple[datetime.date, UUID], dict] = {}
+        month = start
+        while month < stop:
+            next_month = _next_month(month)
+            latest: dict[UUID, dict] = {}
+            for budget in budgets:
+                if not _overlaps(budget["start"], budget["end"], month, next_month):
+                    continue
+                current = latest.get(budget["category_id"])
+                if current is None or (
+                    budget["start"] is not None
+                    and (current["start"] is None or budget["start"] > current["start"])
+                ):
+                    latest[budget["category_id"]] = budget
+            for category_id, budget in latest.items():
+                rows[month, category_id] = {
+                    "month": month,
+                    "category_id": category_id,
+                    "budgeted": budget["amount"],
+                    "spent": 0,
+                }
+
+            first = bisect.bisect_left(keys, (month,))
+            last = bisect.bisect_left(keys, (next_month,))
+            for _, transaction_id in keys[first:last]:
+                transaction = self.store.transactions[transaction_id]
+                row = rows.setdefault(
+                    (month, transaction["category_id"]),
+                    {
+                        "month": month,
+                        "category_id": transaction["category_id"],
+                        "budgeted": None,
+                        "spent": 0,
+                    },
+                )
+                row["spent"] += transaction["amount"]
+            month = next_month
+
+        return [rows[key] for key in sorted(rows)]
+
+    async def list(self, user_id: UUID, on: datetime.date | None = None) -> list[dict]:
+        """Get all budget periods owned by the given user, or those including on"""
+        budgets = [
+            {
+                key: budget[key]
+                for key in ("id", "amount", "category_id", "start", "end")
+            }
+            for budget in self.store.user_budgets.get(user_id, {}).values()
+            if on is None
+            or _overlaps(
+                budget["start"], budget["end"], on, on + datetime.timedelta(days=1)
+            )
+        ]
+        budgets.sort(
+            key=lambda budget: (
+                budget["category_id"],
+                budget["start"] is not None,
+                budget["start"] or datetime.date.min,
+            )
+        )
+        return budgets
+
+    async def create(
+        self,
+        amount: int,
+        category_id: UUID,
+        user_id: UUID,
+        start: datetime.date | None,
+        end: datetime.date | None = None,
+    ) -> UUID:
+        """Create new budget for the period from start until the day before end"""
+        if category_id not in self.store.categories:
+            raise _conflict("category does not exist")
+        self._check_overlap(user_id, category_id, start, end)
+
+        budget_id = uuid.uuid4()
+        budget = {
+            "id": budget_id,
+            "amount": amount,
+            "category_id": category_id,
+            "user_id": user_id,
+            "start": start,
+            "end": end,
+        }
+        self.store.budgets[budget_id] = budget
+        self.store.user_budgets.setdefault(user_id, {})[budget_id] = budget
+        self.store.bump_data_version(user_id)
+        return budget_id
+
+    async def update(
+        self,
+        amount: int,
+        budget_id: UUID,
+        user_id: UUID,
+        effective: datetime.date,
+    ):
+        """
+        Change the amount of a budget owned by the given user from effective on,
+        keeping the old amount for the time before it. A period ending before
+        effective is refused.
+        """
+        budget = self._get_owned(budget_id, user_id)
+        if budget["end"] is not None and effective >= budget["end"]:
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=BUDGET_PERIOD_ENDED,
+            )
+
+        if budget["amount"] == amount:
+            return
+
+        start = budget["start"]
+        if start is None or start < effective:
+            history_id = uuid.uuid4()
+            history = dict(budget, id=history_id, end=effective)
+            self.store.budgets[history_id] = history
+            self.store.user_budgets[user_id][history_id] = history
+            budget["start"] = effective
+
+        budget["amount"] = amount
+        self.store.bump_data_version(user_id)
+
+    async def delete(self, budget_id: UUID, user_id: UUID):
+        """Delete a budget period owned by the given user"""
+        self._get_owned(budget_id, user_id)
+        del self.store.budgets[budget_id]
+        del self.store.user_budgets[user_id][budget_id]
+        self.store.bump_data_version(user_id)
+
+
+def _fingerprint(
+    user_id: UUID,
+    date: datetime.date,
+    amount: int,
+    merchant_id: UUID,
+    occurrence: int,
+) -> tuple:
+    return (user_id, date, amount, merchant_id, occurrence)
+
+
+def _overlaps(
+    start: datetime.date | None,
+    end: datetime.date | None,
+    other_start: datetime.date | None,
+    other_end: datetime.date | None,
+) -> bool:
+    """
+    The period from start until the day before end shares a day with the other
+    period. A missing bound is unbounded.
+    """
+    return (start is None or other_end is None or start < other_end) and (
+        end is None or other_start is None or other_start < end
+    )
+
+
+def _next_month(date: datetime.date) -> datetime.date:
+    return (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+MEMORY_REPOSITORIES = RepositorySet(
+    user=MemoryUserRepository,
+    category=MemoryCategoryRepository,
+    merchant=MemoryMerchantRepository,
+    transaction=MemoryTransactionRepository,
+    budget=MemoryBudgetRepository,
+)
@@ -1,4 +1,6 @@
 """Merchant repository"""
+import asyncio
+import time
 from uuid import UUID
 
 import fastapi
@@ -6,8 +8,33 @@ from psycopg import AsyncConnection
 from psycopg.errors import IntegrityError
 from psycopg.rows import dict_row
 
+from app.cache import LRUCache
+from app.config import (
+    MERCHANT_MATCHER_MAX_AGE,
+    MERCHANT_SEARCH_CACHE_PREFIX_LENGTH,
+    MERCHANT_SEARCH_CACHE_SIZE,
+    MERCHANT_SEARCH_CACHE_TTL,
+)
+from app.db.shard import replication
+from app.matcher import MerchantMatcher, merchant_matcher
+
 MERCHANT_404 = {"message": "No merchant could be found with the provided ID"}
 
+# Weight of ln(1 + uses) of a merchant by the searching user against the 0-1
+# trigram similarity of its name
+SEARCH_USAGE_WEIGHT = 0.1
+SEARCH_CANDIDATES = 200
+
+_matcher_lock = asyncio.Lock()
+_search_cache = LRUCache(MERCHANT_SEARCH_CACHE_SIZE)
+
+
+def _matcher_is_stale() -> bool:
+    return (
+        merchant_matcher.loaded_at is None
+        or time.monotonic() - merchant_matcher.loaded_at > MERCHANT_MATCHER_MAX_AGE
+    )
+
 
 class MerchantRepository:
     """Merchant repository. Encapsulates database access for merchant objects"""
@@ -29,6 +56,57 @@ class MerchantRepository:
 
         return result
 
+    async def search(self, query: str, user_id: UUID, limit: int = 10) -> list[dict]:
+        """
+        Search merchants by name. Prefix matches and trigram similarity rank first,
+        boosted by how often the given user has used the merchant. Results for short
+        queries are cached because every autocomplete session starts with them.
+        """
+        query = query.strip()
+        cache_key = (user_id, query.lower(), limit)
+        cacheable = len(query) <= MERCHANT_SEARCH_CACHE_PREFIX_LENGTH
+        if cacheable:
+            cached = _search_cache.get(cache_key)
+            if cached is not None and cached[0] > time.monotonic():
+                return cached[1]
+
+        sql = (
+            "WITH candidates AS ("
+            "  SELECT id, name, "
+            "    similarity(name, %(query)s) + (name ILIKE %(prefix)s)::int AS score "
+            "  FROM merchant "
+            "  WHERE name ILIKE %(prefix)s OR name %% %(query)s "
+            "  ORDER BY score DESC "
+            "  LIMIT %(candidates)s"
+            ") "
+            "SELECT c.id, c.name "
+            "FROM candidates c "
+            "LEFT JOIN LATERAL ("
+            '  SELECT count(*) AS uses FROM "transaction" t '
+            "  WHERE t.user_id = %(user_id)s AND t.merchant_id = c.id"
+            ") u ON true "
+            "ORDER BY c.score + %(usage_weight)s * ln(1 + u.uses) DESC, c.name "
+            "LIMIT %(limit)s;"
+        )
+        escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params = {
+            "query": query,
+            "prefix": f"{escaped}%",
+            "candidates": SEARCH_CANDIDATES,
+            "user_id": user_id,
+            "usage_weight": SEARCH_USAGE_WEIGHT,
+            "limit": limit,
+        }
+        async with self.conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(sql, params)
+            result = await cursor.fetchall()
+
+        if cacheable:
+            _search_cache.set(
+                cache_key, (time.monotonic() + MERCHANT_SEARCH_CACHE_TTL, result)
+            )
+        return result
+
     async def list(self) -> list[dict]:
         """Get all categories"""
         sql = "SELECT * FROM merchant;"
@@ -38,26 +116,40 @@ class MerchantRepository:
 
     async def create(self, name: str) -> UUID:
         """Create new merchant"""
-        sql = "INSERT INTO merchant (name) VALUES (%s) RETURNING id;"
+        sql = "INSERT INTO merchant (name) VALUES (%s) RETURNING *;"
         try:
-            async with self.conn.transaction(), self.conn.cursor() as cursor:
-                await cursor.execute(sql, (name,))
-                result = await cursor.fetchone()
-                return result[0]
+            async with replication() as replicas:
+                async with self.conn.transaction(), self.conn.cursor(
+                    row_factory=dict_row
+                ) as cursor:
+                    await cursor.execute(sql, (name,))
+                    result = await cursor.fetchone()
+                    await replicas.replicate("merchant", result)
         except IntegrityError as err:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_409_CONFLICT,
                 detail={"message": str(err)},
             )
 
+        _search_cache.clear()
+        if merchant_matcher.loaded_at is not None:
+            merchant_matcher.set_name(result["id"], name)
+        return result["id"]
+
     async def update(self, name: str, merchant_id: UUID):
         """Update a merchant"""
-        sql = "UPDATE merchant SET name = %s WHERE id = %s;"
+        sql = "UPDATE merchant SET name = %s WHERE id = %s RETURNING *;"
 
         try:
-            async with self.conn.transaction(), self.conn.cursor() as cursor:
-                await cursor.execute(sql, (name, merchant_id))
-                not_found = cursor.rowcount == 0
+            async with replication() as replicas:
+                async with self.conn.transaction(), self.conn.cursor(
+                    row_factory=dict_row
+                ) as cursor:
+                    await cursor.execute(sql, (name, merchant_id))
+                    result = await cursor.fetchone()
+                    not_found = result is None
+                    if not not_found:
+                        await replicas.replicate("merchant", result)
         except IntegrityError as err:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_409_CONFLICT,
@@ -69,14 +161,75 @@ class MerchantRepository:
                 status_code=fastapi.status.HTTP_404_NOT_FOUND, detail=MERCHANT_404
             )
 
+        _search_cache.clear()
+        if merchant_matcher.loaded_at is not None:
+            merchant_matcher.set_name(merchant_id, name)
+
     async def delete(self, merchant_id: UUID):
         """Delete a merchant"""
         sql = "DELETE FROM merchant WHERE id = %s;"
-        async with self.conn.transaction(), self.conn.cursor() as cursor:
-            await cursor.execute(sql, (merchant_id,))
-            not_found = cursor.rowcount == 0
+        try:
+            async with replication() as replicas:
+                async with self.conn.transaction(), self.conn.cursor() as cursor:
+                    await cursor.execute(sql, (merchant_id,))
+                    not_found = cursor.rowcount == 0
+                    if not not_found:
+                        await replicas.replicate_delete("merchant", merchant_id)
+        except IntegrityError as err:
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_409_CONFLICT,
+                detail={"message": str(err)},
+            ) from err
 
         if not_found:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_404_NOT_FOUND, detail=MERCHANT_404
             )
+
+        _search_cache.clear()
+        if merchant_matcher.loaded_at is not None:
+            merchant_matcher.remove(merchant_id)
+
+    async def create_alias(
+        self, pattern: str, merchant_id: UUID, user_id: UUID
+    ) -> UUID:
+        """Create new alias pattern for a merchant matching for a user"""
+        sql = (
+            "INSERT INTO merchant_alias (pattern, merchant_id, user_id) "
+            "VALUES (%s, %s, %s) RETURNING id;"
+        )
+        try:
+            async with self.conn.transaction(), self.conn.cursor() as cursor:
+                await cursor.execute(sql, (pattern, merchant_id, user_id))
+                result = await cursor.fetchone()
+        except IntegrityError as err:
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_409_CONFLICT,
+                detail={"message": str(err)},
+            )
+
+        if merchant_matcher.loaded_at is not None:
+            merchant_matcher.add_alias(merchant_id, pattern, user_id)
+        return result[0]
+
+    async def get_matcher(self) -> MerchantMatcher:
+        """
+        Get the process wide descriptor matcher. It is built on first use, kept
+        current with changes made by this process and rebuilt once it is older than
+        MERCHANT_MATCHER_MAX_AGE to pick up changes made by other workers.
+        """
+        if not _matcher_is_stale():
+            return merchant_matcher
+
+        async with _matcher_lock:
+            if _matcher_is_stale():
+                async with self.conn.cursor() as cursor:
+                    await cursor.execute("SELECT id, name FROM merchant;")
+                    merchants = await cursor.fetchall()
+                    await cursor.execute(
+                        "SELECT merchant_id, pattern, user_id FROM merchant_alias;"
+                    )
+                    aliases = await cursor.fetchall()
+                merchant_matcher.load(merchants, aliases)
+
+        return merchant_matcher
@@ -0,0 +1,234 @@
+"""
+Shard maintenance tool, run with python -m app.db.rebalance.
+
+    sync                Copy the global tables from the primary to every shard
+    pin                 Pin every user to their current shard before the
+                        POSTGRES_SHARDS list changes
+    move USER_ID SHARD  Move a user's transactions and budgets to another shard
+
+A move is online. Writes by the user get a 503 while the rows are copied and reads
+are served from the source shard until the directory points at the target.
+"""
+import argparse
+import time
+from uuid import UUID
+
+import psycopg
+from psycopg import sql
+
+from app.config import (
+    POSTGRES_SHARDS,
+    ROUTE_STATEMENT_TIMEOUTS_MS,
+    SHARD_DIRECTORY_TTL,
+    STATEMENT_TIMEOUT_MS,
+)
+from app.db.shard import GLOBAL_TABLES, USER_TABLES, HashRing
+
+# Seconds for every worker to see a directory change and for requests routed
+# before it to finish
+_SETTLE_SECONDS = (
+    SHARD_DIRECTORY_TTL
+    + max(STATEMENT_TIMEOUT_MS, *ROUTE_STATEMENT_TIMEOUTS_MS.values()) / 1000
+    + 1
+)
+
+
+def _columns(conn: psycopg.Connection, table: str) -> list[str]:
+    """Columns of a table that are copied, generated columns are computed again"""
+    cursor = conn.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = 'public' AND table_name = %s AND is_generated = 'NEVER' "
+        "ORDER BY ordinal_position;",
+        (table,),
+    )
+    return [row[0] for row in cursor]
+
+
+def _copy_rows(
+    source: psycopg.Connection,
+    target: psycopg.Connection,
+    table: str,
+    columns: list[str],
+    condition: sql.Composable = sql.SQL("true"),
+    params=None,
+    into: str | None = None,
+):
+    """
+    Stream the rows of a table matching condition from source to the same table,
+    or the into table, on target
+    """
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    copy_out = sql.SQL(
+        "COPY (SELECT {columns} FROM {table} WHERE {condition}) "
+        "TO STDOUT (FORMAT BINARY);"
+    ).format(columns=column_list, table=sql.Identifier(table), condition=condition)
+    copy_in = sql.SQL("COPY {table} ({columns}) FROM STDIN (FORMAT BINARY);").format(
+        table=sql.Identifier(into or table), columns=column_list
+    )
+    with source.cursor().copy(copy_out, params) as reader, target.cursor().copy(
+        copy_in
+    ) as writer:
+        for data in reader:
+            writer.write(data)
+
+
+def _locate(primary: psycopg.Connection, user_id: UUID) -> int:
+    row = primary.execute(
+        "SELECT shard FROM shard_directory WHERE user_id = %s;", (user_id,)
+    ).fetchone()
+    return row[0] if row else HashRing(len(POSTGRES_SHARDS)).shard_for(user_id)
+
+
+def sync(primary: psycopg.Connection, shards: list[psycopg.Connection]):
+    """
+    Make the global tables on every shard match the primary. Run it after adding a
+    shard or when one missed replicated writes.
+    """
+    for conn in shards[1:]:
+        with conn.transaction():
+            for table in GLOBAL_TABLES:
+                columns = _columns(primary, table)
+                conn.execute(
+                    sql.SQL("CREATE TEMPORARY TABLE incoming (LIKE {table});").format(
+                        table=sql.Identifier(table)
+                    )
+                )
+                _copy_rows(primary, conn, table, columns, into="incoming")
+                conn.execute(
+                    sql.SQL(
+                        "INSERT INTO {table} ({columns}) "
+                        "SELECT {columns} FROM incoming "
+                        "ON CONFLICT (id) DO UPDATE SET {updates};"
+                    ).format(
+                        table=sql.Identifier(table),
+                        columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+                        updates=sql.SQL(", ").join(
+                            sql.SQL("{column} = EXCLUDED.{column}").format(
+                                column=sql.Identifier(column)
+                            )
+                            for column in columns
+                        ),
+                    )
+                )
+                conn.execute(
+                    sql.SQL(
+                        "DELETE FROM {table} t WHERE NOT EXISTS "
+                        "(SELECT FROM incoming i WHERE i.id = t.id);"
+                    ).format(table=sql.Identifier(table))
+                )
+                conn.execute("DROP TABLE incoming;")
+
+
+def pin(primary: psycopg.Connection):
+    """
+    Pin users without a directory entry to their position on the current hash ring
+    so changing the number of shards does not move them implicitly
+    """
+    ring = HashRing(len(POSTGRES_SHARDS))
+    with primary.transaction():
+        user_ids = [
+            row[0]
+            for row in primary.execute(
+                'SELECT id FROM "user" u WHERE NOT EXISTS '
+                "(SELECT FROM shard_directory d WHERE d.user_id = u.id);"
+            )
+        ]
+        with primary.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO shard_directory (user_id, shard) VALUES (%s, %s);",
+                [(user_id, ring.shard_for(user_id)) for user_id in user_ids],
+            )
+
+
+def move(
+    primary: psycopg.Connection,
+    shards: list[psycopg.Connection],
+    user_id: UUID,
+    target_shard: int,
+):
+    """
+    Move a user's rows to target_shard. The user is marked as moving, the rows are
+    copied once in-flight writes have settled, the directory is pointed at the
+    target and the source rows are removed once no worker reads them anymore.
+    """
+    source_shard = _locate(primary, user_id)
+    if source_shard == target_shard:
+        return
+
+    source, target = shards[source_shard], shards[target_shard]
+    primary.execute(
+        "INSERT INTO shard_directory (user_id, shard, moving) VALUES (%s, %s, true) "
+        "ON CONFLICT (user_id) DO UPDATE SET moving = true;",
+        (user_id, source_shard),
+    )
+    try:
+        time.sleep(_SETTLE_SECONDS)
+        with target.transaction():
+            for table in reversed(USER_TABLES):
+                target.execute(
+                    sql.SQL("DELETE FROM {table} WHERE user_id = %s;").format(
+                        table=sql.Identifier(table)
+                    ),
+                    (user_id,),
+                )
+            for table in USER_TABLES:
+                _copy_rows(
+                    source,
+                    target,
+                    table,
+                    _columns(source, table),
+                    sql.SQL("user_id = %s"),
+                    (user_id,),
+                )
+    except BaseException:
+        primary.execute(
+            "UPDATE shard_directory SET moving = false WHERE user_id = %s;",
+            (user_id,),
+        )
+        raise
+
+    primary.execute(
+        "UPDATE shard_directory SET shard = %s, moving = false WHERE user_id = %s;",
+        (target_shard, user_id),
+    )
+    time.sleep(_SETTLE_SECONDS)
+    with source.transaction():
+        for table in reversed(USER_TABLES):
+            source.execute(
+                sql.SQL("DELETE FROM {table} WHERE user_id = %s;").format(
+                    table=sql.Identifier(table)
+                ),
+                (user_id,),
+            )
+
+
+def main():
+    """Parse the command line and run the maintenance command"""
+    parser = argparse.ArgumentParser(description="Shard maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("sync", help="copy global tables to every shard")
+    commands.add_parser("pin", help="pin every user to their current shard")
+    move_parser = commands.add_parser("move", help="move a user to another shard")
+    move_parser.add_argument("user_id", type=UUID)
+    move_parser.add_argument(
+        "shard", type=int, choices=range(len(POSTGRES_SHARDS)), metavar="shard"
+    )
+    args = parser.parse_args()
+
+    shards = [
+        psycopg.connect(conninfo, autocommit=True) for conninfo in POSTGRES_SHARDS
+    ]
+    try:
+        if args.command == "sync":
+            sync(shards[0], shards)
+        elif args.command == "pin":
+            pin(shards[0])
+        else:
+            move(shards[0], shards, args.user_id, args.shard)
+    finally:
+        for conn in shards:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
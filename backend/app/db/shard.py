@@ -0,0 +1,145 @@
+"""
+Routing of per-user data across Postgres shards.
+
+Shard 0 is the primary. It holds the users, the shard directory and the merchant
+aliases, and is the source of truth for the global category and merchant tables,
+which are replicated to every other shard. A user's transactions and budgets live
+on one shard: the one pinned in shard_directory, or otherwise the user's position
+on a consistent hash ring.
+"""
+import bisect
+import hashlib
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from uuid import UUID
+
+import psycopg_pool
+from psycopg import sql
+
+from app.cache import LRUCache
+from app.config import SHARD_DIRECTORY_CACHE_SIZE, SHARD_DIRECTORY_TTL
+
+# Tables holding rows owned by one user, in the order they are copied between shards
+USER_TABLES = ("budget", "transaction", "user_data_version", "archived_transaction")
+
+# Tables copied from the primary to every shard
+GLOBAL_TABLES = ("user", "category", "merchant")
+
+_RING_REPLICAS = 128
+
+
+def _hash(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes for each shard"""
+
+    def __init__(self, shard_count: int, replicas: int = _RING_REPLICAS):
+        points = sorted(
+            (_hash(f"{shard}:{replica}".encode()), shard)
+            for shard in range(shard_count)
+            for replica in range(replicas)
+        )
+        self._points = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def shard_for(self, user_id: UUID) -> int:
+        """Get the shard a user hashes to"""
+        index = bisect.bisect(self._points, _hash(user_id.bytes))
+        return self._shards[index % len(self._shards)]
+
+
+class ShardRouter:
+    """Maps users to shard pools. Directory entries are cached for a short TTL."""
+
+    def __init__(self, pools: list[psycopg_pool.AsyncConnectionPool]):
+        self.pools = pools
+        self.ring = HashRing(len(pools))
+        self._directory = LRUCache(SHARD_DIRECTORY_CACHE_SIZE)
+
+    async def locate(self, user_id: UUID) -> tuple[int, bool]:
+        """Get the user's shard and whether the user is being moved off it"""
+        cached = self._directory.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1], cached[2]
+
+        async with self.pools[0].connection() as conn:
+            cursor = await conn.execute(
+                "SELECT shard, moving FROM shard_directory WHERE user_id = %s;",
+                (user_id,),
+            )
+            row = await cursor.fetchone()
+
+        shard, moving = row if row else (self.ring.shard_for(user_id), False)
+        self._directory.set(
+            user_id, (time.monotonic() + SHARD_DIRECTORY_TTL, shard, moving)
+        )
+        return shard, moving
+
+
+class Replication:
+    """
+    Global table writes replicated to every shard except the primary. Statements
+    run in a transaction on each shard that stays open until the replication
+    context exits.
+    """
+
+    def __init__(self, stack: AsyncExitStack, pools: list):
+        self._stack = stack
+        self._pools = pools
+        self._conns: list | None = None
+
+    async def _execute(self, query: sql.Composable, params):
+        if self._conns is None:
+            self._conns = []
+            for pool in self._pools:
+                conn = await self._stack.enter_async_context(pool.connection())
+                await self._stack.enter_async_context(conn.transaction())
+                self._conns.append(conn)
+
+        for conn in self._conns:
+            await conn.execute(query, params)
+
+    async def replicate(self, table: str, row: dict):
+        """Insert or update a global table row"""
+        columns = list(row)
+        query = sql.SQL(
+            "INSERT INTO {table} ({columns}) VALUES ({values}) "
+            "ON CONFLICT (id) DO UPDATE SET {updates};"
+        ).format(
+            table=sql.Identifier(table),
+            columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+            values=sql.SQL(", ").join(map(sql.Placeholder, columns)),
+            updates=sql.SQL(", ").join(
+                sql.SQL("{column} = EXCLUDED.{column}").format(
+                    column=sql.Identifier(column)
+                )
+                for column in columns
+            ),
+        )
+        await self._execute(query, row)
+
+    async def replicate_delete(self, table: str, row_id: UUID):
+        """Delete a global table row"""
+        query = sql.SQL("DELETE FROM {table} WHERE id = %s;").format(
+            table=sql.Identifier(table)
+        )
+        await self._execute(query, (row_id,))
+
+
+# Router of the running app, None when everything lives in a single database
+shard_router: ShardRouter | None = None
+
+
+@asynccontextmanager
+async def replication():
+    """
+    Replicate the global table writes of a primary transaction to the other
+    shards. Enter it before the primary's transaction so the shards only commit
+    after the primary did, and roll back when the primary or any shard fails. A
+    shard failing to commit after the primary is repaired by rebalance sync.
+    """
+    async with AsyncExitStack() as stack:
+        pools = shard_router.pools[1:] if shard_router is not None else []
+        yield Replication(stack, pools)
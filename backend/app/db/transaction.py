@@ -1,6 +1,6 @@
 """Transaction repository"""
 import datetime
-from decimal import Decimal
+import time
 from uuid import UUID
 
 import fastapi
@@ -8,7 +8,31 @@ from psycopg import AsyncConnection
 from psycopg.errors import IntegrityError
 from psycopg.rows import dict_row
 
+from app.config import CATEGORY_MODEL_MAX_AGE
+from app.db.archive import archived_category_counts, merge_archived
+from app.db.data_version import bump_data_version, get_data_version
+from app.suggest import CategoryModel, category_models
+
 TRANSACTION_404 = {"message": "No transaction could be found with the provided ID"}
+DUPLICATE_TRANSACTION = {
+    "message": "An equal transaction already exists, "
+    "give this one a higher occurrence to add it anyway"
+}
+
+# Skips transactions whose fingerprint is in the table or the archive
+_INSERT_SQL = (
+    'INSERT INTO "transaction" '
+    '(amount, "date", user_id, merchant_id, category_id, occurrence) '
+    "SELECT r.amount, r.date, %(user_id)s, r.merchant_id, r.category_id, "
+    "r.occurrence FROM {rows} "
+    "WHERE NOT EXISTS ("
+    "  SELECT FROM archived_transaction a "
+    "  WHERE a.user_id = %(user_id)s AND a.fingerprint = transaction_fingerprint("
+    "    %(user_id)s, r.date, r.amount, r.merchant_id, r.occurrence"
+    "  )"
+    ") "
+    "ON CONFLICT (user_id, fingerprint) DO NOTHING "
+)
 
 
 class TransactionRepository:
@@ -20,7 +44,7 @@ class TransactionRepository:
     async def get(self, transaction_id: UUID, user_id: UUID) -> dict:
         """Get a specific transaction"""
         sql = 'SELECT * FROM "transaction" WHERE id = %s AND user_id = %s'
-        async with self.conn.cursor() as cursor:
+        async with self.conn.cursor(binary=True) as cursor:
             await cursor.execute(f"{sql};", (transaction_id, user_id))
             result = await cursor.fetchone()
 
@@ -31,6 +55,55 @@ class TransactionRepository:
 
         return result
 
+    async def create_many(
+        self, transactions: list[dict], user_id: UUID
+    ) -> list[UUID | None]:
+        """
+        Create transactions in one statement, skipping those equal to an existing
+        one. Returns the ID of each created transaction and None for skipped ones.
+        """
+        rows = (
+            "unnest(%(amounts)s::bigint[], %(dates)s::date[], "
+            "%(merchant_ids)s::uuid[], %(category_ids)s::uuid[], "
+            "%(occurrences)s::integer[]) "
+            "AS r(amount, date, merchant_id, category_id, occurrence)"
+        )
+        sql = _INSERT_SQL.format(rows=rows) + (
+            'RETURNING id, amount, "date", merchant_id, occurrence;'
+        )
+        params = {
+            "user_id": user_id,
+            "amounts": [row["amount"] for row in transactions],
+            "dates": [row["date"] for row in transactions],
+            "merchant_ids": [row["merchant_id"] for row in transactions],
+            "category_ids": [row["category_id"] for row in transactions],
+            "occurrences": [row["occurrence"] for row in transactions],
+        }
+        try:
+            async with self.conn.transaction(), self.conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                created = {tuple(row[1:]): row[0] for row in await cursor.fetchall()}
+                if created:
+                    await bump_data_version(cursor, user_id)
+        except IntegrityError as err:
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_409_CONFLICT,
+                detail={"message": str(err)},
+            ) from err
+
+        if created:
+            # Rebuilt on next use rather than updated row by row
+            category_models.pop(user_id)
+
+        # An equal transaction given twice is only created for the first one
+        return [
+            created.pop(
+                (row["amount"], row["date"], row["merchant_id"], row["occurrence"]),
+                None,
+            )
+            for row in transactions
+        ]
+
     async def list(
         self,
         user_id: UUID,
@@ -38,7 +111,10 @@ class TransactionRepository:
         prev_id: UUID | None = None,
         limit: int = 50,
     ) -> list[dict]:
-        """Get all categories"""
+        """
+        Get a page of the user's transactions, newest first, including archived
+        transactions once the page reaches them
+        """
         conditions = ["user_id = %s"]
         params = [user_id]
         if prev_date:
@@ -51,23 +127,30 @@ class TransactionRepository:
         where_clause = " AND ".join(conditions)
         sql = f'SELECT * FROM "transaction" WHERE {where_clause} ORDER BY "date" DESC LIMIT %s;'
         params.append(limit)
-        async with self.conn.cursor(row_factory=dict_row) as cursor:
+        async with self.conn.cursor(row_factory=dict_row, binary=True) as cursor:
             await cursor.execute(sql, params)
-            return await cursor.fetchall()
+            rows = await cursor.fetchall()
+
+        return await merge_archived(user_id, rows, prev_date, prev_id, limit)
 
     async def create(
         self,
-        amount: Decimal,
+        amount: int,
         date: datetime.date,
         merchant_id: UUID,
         category_id: UUID,
         user_id: UUID,
+        occurrence: int = 1,
     ) -> UUID:
-        """Create new transaction"""
-        sql = (
-            'INSERT INTO "transaction" (amount, "date", user_id, merchant_id, category_id) '
-            "VALUES (%(amount)s, %(date)s, %(user_id)s, %(merchant_id)s, %(category_id)s) "
-            "RETURNING id;"
+        """Create new transaction unless an equal one exists"""
+        rows = (
+            "(SELECT %(amount)s::bigint AS amount, %(date)s::date AS date, "
+            "%(merchant_id)s::uuid AS merchant_id, "
+            "%(category_id)s::uuid AS category_id, "
+            "%(occurrence)s::integer AS occurrence) AS r"
+        )
+        sql = _INSERT_SQL.format(rows=rows) + (
+            "RETURNING id, (SELECT name FROM merchant WHERE id = %(merchant_id)s);"
         )
         params = {
             "amount": amount,
@@ -75,33 +158,55 @@ class TransactionRepository:
             "user_id": user_id,
             "merchant_id": merchant_id,
             "category_id": category_id,
+            "occurrence": occurrence,
         }
         try:
             async with self.conn.transaction(), self.conn.cursor() as cursor:
                 await cursor.execute(sql, params)
                 result = await cursor.fetchone()
-                return result[0]
+                if result is not None:
+                    await bump_data_version(cursor, user_id)
         except IntegrityError as err:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_409_CONFLICT,
                 detail={"message": str(err)},
             )
 
+        if result is None:
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_409_CONFLICT,
+                detail=DUPLICATE_TRANSACTION,
+            )
+
+        _record_category(user_id, merchant_id, result[1], amount, category_id, 1)
+        return result[0]
+
     async def update(
         self,
         transaction_id: UUID,
-        amount: Decimal,
+        amount: int,
         date: datetime.date,
         merchant_id: UUID,
         category_id: UUID,
         user_id: UUID,
+        occurrence: int | None = None,
     ):
-        """Update a transaction"""
+        """Update a transaction. Its occurrence is kept unless given."""
         sql = (
-            'UPDATE "transaction" '
+            'UPDATE "transaction" t '
             'SET amount = %(amount)s, "date" = %(date)s, '
-            "category_id = %(category_id)s, merchant_id = %(merchant_id)s "
-            "WHERE id = %(transaction_id)s AND user_id = %(user_id)s;"
+            "category_id = %(category_id)s, merchant_id = %(merchant_id)s, "
+            "occurrence = coalesce(%(occurrence)s::integer, old.occurrence) "
+            "FROM ("
+            "  SELECT id, amount, merchant_id, category_id, occurrence "
+            '  FROM "transaction" '
+            "  WHERE id = %(transaction_id)s AND user_id = %(user_id)s "
+            "  FOR UPDATE"
+            ") AS old "
+            "WHERE t.id = old.id "
+            "RETURNING old.amount, old.merchant_id, old.category_id, "
+            "(SELECT name FROM merchant WHERE id = old.merchant_id), "
+            "(SELECT name FROM merchant WHERE id = t.merchant_id);"
         )
         params = {
             "transaction_id": transaction_id,
@@ -110,30 +215,104 @@ class TransactionRepository:
             "merchant_id": merchant_id,
             "category_id": category_id,
             "user_id": user_id,
+            "occurrence": occurrence,
         }
         try:
             async with self.conn.transaction(), self.conn.cursor() as cursor:
                 await cursor.execute(sql, params)
-                not_found = cursor.rowcount == 0
+                result = await cursor.fetchone()
+                if result is not None:
+                    await bump_data_version(cursor, user_id)
         except IntegrityError as err:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_409_CONFLICT,
                 detail={"message": str(err)},
             ) from err
 
-        if not_found:
+        if result is None:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_404_NOT_FOUND, detail=TRANSACTION_404
             )
 
+        old_amount, old_merchant_id, old_category_id, old_name, new_name = result
+        _record_category(
+            user_id, old_merchant_id, old_name, old_amount, old_category_id, -1
+        )
+        _record_category(user_id, merchant_id, new_name, amount, category_id, 1)
+
     async def delete(self, transaction_id: UUID, user_id: UUID):
         """Delete a transaction"""
-        sql = 'DELETE FROM "transaction" WHERE id = %s AND user_id = %s;'
+        sql = (
+            'DELETE FROM "transaction" t WHERE t.id = %s AND t.user_id = %s '
+            "RETURNING t.merchant_id, "
+            "(SELECT m.name FROM merchant m WHERE m.id = t.merchant_id), "
+            "t.amount, t.category_id;"
+        )
         async with self.conn.transaction(), self.conn.cursor() as cursor:
             await cursor.execute(sql, (transaction_id, user_id))
-            not_found = cursor.rowcount == 0
+            result = await cursor.fetchone()
+            if result is not None:
+                await bump_data_version(cursor, user_id)
 
-        if not_found:
+        if result is None:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_404_NOT_FOUND, detail=TRANSACTION_404
             )
+
+        _record_category(user_id, *result, -1)
+
+    async def get_data_version(
+        self, user_id: UUID
+    ) -> tuple[int, datetime.datetime | None]:
+        """Get the version of the user's transactions and budgets"""
+        return await get_data_version(self.conn, user_id)
+
+    async def get_category_model(self, user_id: UUID) -> CategoryModel:
+        """
+        Get the category suggestion model for the given user, trained on their
+        hot and archived transactions. Models are cached per process, kept current
+        with changes made through this repository and reloaded once older than
+        CATEGORY_MODEL_MAX_AGE.
+        """
+        model = category_models.get(user_id)
+        if (
+            model is not None
+            and time.monotonic() - model.loaded_at <= CATEGORY_MODEL_MAX_AGE
+        ):
+            return model
+
+        sql = (
+            "SELECT t.merchant_id, m.name, t.amount, t.category_id, "
+            "  sum(t.count)::bigint "
+            "FROM ("
+            "  SELECT merchant_id, amount, category_id, count(*) "
+            '  FROM "transaction" WHERE user_id = %s '
+            "  GROUP BY merchant_id, amount, category_id "
+            "  UNION ALL "
+            "  SELECT * FROM unnest(%s::uuid[], %s::bigint[], %s::uuid[], %s::bigint[])"
+            ") AS t(merchant_id, amount, category_id, count) "
+            "JOIN merchant m ON m.id = t.merchant_id "
+            "GROUP BY t.merchant_id, m.name, t.amount, t.category_id;"
+        )
+        archived = await archived_category_counts(user_id)
+        model = CategoryModel()
+        async with self.conn.cursor(binary=True) as cursor:
+            await cursor.execute(sql, (user_id, *archived))
+            async for merchant_id, name, amount, category_id, count in cursor:
+                model.add(merchant_id, name, amount, category_id, count)
+
+        category_models.set(user_id, model)
+        return model
+
+
+def _record_category(
+    user_id: UUID,
+    merchant_id: UUID,
+    merchant_name: str,
+    amount: int,
+    category_id: UUID,
+    count: int,
+):
+    model = category_models.get(user_id)
+    if model is not None:
+        model.add(merchant_id, merchant_name, amount, category_id, count)
@@ -4,6 +4,8 @@ from psycopg import AsyncConnection
 from psycopg.errors import IntegrityError
 from psycopg.rows import dict_row
 
+from app.db.shard import replication
+
 USER_404 = {"message": "No user could be found with the provided ID"}
 
 
@@ -24,7 +26,8 @@ class UserRepository:
         """Create new user"""
         sql = (
             'INSERT INTO "user" (username, email, hashed_password) '
-            "VALUES (%(username)s, %(email)s, %(hashed_password)s)"
+            "VALUES (%(username)s, %(email)s, %(hashed_password)s) "
+            "RETURNING *;"
         )
         params = {
             "username": username,
@@ -32,8 +35,12 @@ class UserRepository:
             "hashed_password": hashed_password,
         }
         try:
-            async with self.conn.transaction(), self.conn.cursor() as cursor:
-                await cursor.execute(sql, params)
+            async with replication() as replicas:
+                async with self.conn.transaction(), self.conn.cursor(
+                    row_factory=dict_row
+                ) as cursor:
+                    await cursor.execute(sql, params)
+                    await replicas.replicate("user", await cursor.fetchone())
         except IntegrityError as err:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_409_CONFLICT,
@@ -42,12 +49,18 @@ class UserRepository:
 
     async def update(self, username: str, hashed_password: str):
         """Update a user"""
-        sql = "UPDATE user SET hashed_password = %s WHERE username = %s;"
+        sql = 'UPDATE "user" SET hashed_password = %s WHERE username = %s RETURNING *;'
 
         try:
-            async with self.conn.transaction(), self.conn.cursor() as cursor:
-                await cursor.execute(sql, (hashed_password, username))
-                not_found = cursor.rowcount == 0
+            async with replication() as replicas:
+                async with self.conn.transaction(), self.conn.cursor(
+                    row_factory=dict_row
+                ) as cursor:
+                    await cursor.execute(sql, (hashed_password, username))
+                    result = await cursor.fetchone()
+                    not_found = result is None
+                    if not not_found:
+                        await replicas.replicate("user", result)
         except IntegrityError as err:
             raise fastapi.HTTPException(
                 status_code=fastapi.status.HTTP_409_CONFLICT,
@@ -60,11 +73,20 @@ class UserRepository:
             )
 
     async def delete(self, username: str):
-        """Delete a user"""
-        sql = 'UPDATE user SET "disabled" = true WHERE username = %s AND "disabled" = false;'
-        async with self.conn.transaction(), self.conn.cursor() as cursor:
-            await cursor.execute(sql, (username,))
-            not_found = cursor.rowcount == 0
+        """Disable a user"""
+        sql = (
+            'UPDATE "user" SET "disabled" = true '
+            'WHERE username = %s AND "disabled" = false RETURNING *;'
+        )
+        async with replication() as replicas:
+            async with self.conn.transaction(), self.conn.cursor(
+                row_factory=dict_row
+            ) as cursor:
+                await cursor.execute(sql, (username,))
+                result = await cursor.fetchone()
+                not_found = result is None
+                if not not_found:
+                    await replicas.replicate("user", result)
 
         if not_found:
             raise fastapi.HTTPException(
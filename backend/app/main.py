@@ -1,13 +1,36 @@
 """Create and configure FastAPI application"""
 import fastapi
+from fastapi.middleware.gzip import GZipMiddleware
 
-from app import routers
+from app import profiling, routers
+from app.config import (
+    GZIP_COMPRESSLEVEL,
+    GZIP_MINIMUM_SIZE,
+    PROFILING_ENABLED,
+    REPOSITORY_BACKEND,
+)
 from app.db import postgres_pool_lifespan
+from app.db.memory import memory_lifespan
 
+LIFESPANS = {
+    "postgres": postgres_pool_lifespan,
+    "memory": memory_lifespan,
+}
 
-def app_factory():
-    """Create and configure FastAPI instance"""
-    app = fastapi.FastAPI(lifespan=postgres_pool_lifespan)
+
+def app_factory(backend: str = REPOSITORY_BACKEND):
+    """
+    Create and configure FastAPI instance. backend selects where the repositories
+    store data: "postgres", or "memory" to measure the API without a database.
+    """
+    app = fastapi.FastAPI(lifespan=LIFESPANS[backend])
     app.include_router(routers.router)
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=GZIP_MINIMUM_SIZE,
+        compresslevel=GZIP_COMPRESSLEVEL,
+    )
+    if PROFILING_ENABLED:
+        profiling.install(app)
 
     return app
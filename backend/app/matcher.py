@@ -0,0 +1,187 @@
+"""Merchant descriptor normalization and matching"""
+import string
+import time
+from uuid import UUID
+
+# Bank descriptors mix punctuation, store numbers and reference codes in with the
+# merchant name. Punctuation becomes whitespace and any token containing a digit
+# is dropped, so "SQ *BLUE BOTTLE 1234" normalizes to ("SQ", "BLUE", "BOTTLE").
+_PUNCTUATION = str.maketrans({char: " " for char in string.punctuation})
+_TERMINAL = ""
+_MEMO_SIZE = 65536
+
+
+def normalize(text: str) -> tuple[str, ...]:
+    """Normalize a descriptor or merchant name into match tokens"""
+    return tuple(
+        token
+        for token in text.translate(_PUNCTUATION).upper().split()
+        if token.isalpha()
+    )
+
+
+class MerchantMatcher:
+    """
+    Token trie built from merchant names and alias patterns. A descriptor matches
+    the merchant with the longest pattern found anywhere in its tokens.
+
+    The terminal entry of a pattern counts the name and aliases of each merchant
+    ending there, as different merchants can normalize to the same tokens. The
+    merchant added first wins a tie.
+
+    Aliases of a user are kept in a separate trie per user and only match
+    descriptors of that user, winning a tie with the shared names and aliases.
+    """
+
+    def __init__(self):
+        self._root: dict = {}
+        self._names: dict[UUID, tuple[str, ...]] = {}
+        self._aliases: dict[UUID, set[tuple[str, ...]]] = {}
+        self._user_aliases: dict[UUID, MerchantMatcher] = {}
+        self._memo: dict[str, tuple[UUID | None, int]] = {}
+        self.loaded_at: float | None = None
+
+    def load(
+        self,
+        merchants: list[tuple[UUID, str]],
+        aliases: list[tuple[UUID, str, UUID | None]],
+    ):
+        """
+        Rebuild the tries from every merchant name and the merchant_id, pattern
+        and user_id of every alias pattern
+        """
+        self._root = {}
+        self._names = {}
+        self._aliases = {}
+        self._user_aliases = {}
+        self._memo.clear()
+        for merchant_id, name in merchants:
+            self.set_name(merchant_id, name)
+        for merchant_id, pattern, user_id in aliases:
+            self.add_alias(merchant_id, pattern, user_id)
+        self.loaded_at = time.monotonic()
+
+    def set_name(self, merchant_id: UUID, name: str):
+        """Add or replace the name pattern for a merchant"""
+        old_tokens = self._names.pop(merchant_id, None)
+        if old_tokens is not None:
+            self._remove(old_tokens, merchant_id)
+
+        tokens = normalize(name)
+        if tokens:
+            self._names[merchant_id] = tokens
+            self._insert(tokens, merchant_id)
+
+    def add_alias(self, merchant_id: UUID, pattern: str, user_id: UUID | None = None):
+        """Add an alias pattern for a merchant, matching only for user_id if given"""
+        if user_id is not None:
+            user_matcher = self._user_aliases.get(user_id)
+            if user_matcher is None:
+                user_matcher = self._user_aliases[user_id] = MerchantMatcher()
+            user_matcher.add_alias(merchant_id, pattern)
+            return
+
+        tokens = normalize(pattern)
+        aliases = self._aliases.setdefault(merchant_id, set())
+        if tokens and tokens not in aliases:
+            aliases.add(tokens)
+            self._insert(tokens, merchant_id)
+
+    def remove(self, merchant_id: UUID):
+        """Remove a merchant and all of its aliases"""
+        patterns = list(self._aliases.pop(merchant_id, ()))
+        name = self._names.pop(merchant_id, None)
+        if name is not None:
+            patterns.append(name)
+        for tokens in patterns:
+            self._remove(tokens, merchant_id)
+        for user_id, user_matcher in list(self._user_aliases.items()):
+            user_matcher.remove(merchant_id)
+            if not user_matcher._root:
+                del self._user_aliases[user_id]
+
+    def name_tokens(self, merchant_id: UUID) -> tuple[str, ...]:
+        """Get the normalized name tokens of a merchant"""
+        return self._names.get(merchant_id, ())
+
+    def match(self, descriptor: str, user_id: UUID | None = None) -> UUID | None:
+        """Find the merchant for a raw descriptor of user_id"""
+        merchant_id, length = self._longest_match(descriptor)
+        user_matcher = self._user_aliases.get(user_id)
+        if user_matcher is not None:
+            user_merchant_id, user_length = user_matcher._longest_match(descriptor)
+            if user_merchant_id is not None and user_length >= length:
+                return user_merchant_id
+        return merchant_id
+
+    def match_many(
+        self, descriptors: list[str], user_id: UUID | None = None
+    ) -> list[UUID | None]:
+        """Find the merchant for each descriptor of user_id"""
+        match = self.match
+        return [match(descriptor, user_id) for descriptor in descriptors]
+
+    def _longest_match(self, descriptor: str) -> tuple[UUID | None, int]:
+        try:
+            return self._memo[descriptor]
+        except KeyError:
+            pass
+
+        tokens = normalize(descriptor)
+        root = self._root
+        best = None
+        best_length = 0
+        for start in range(len(tokens)):
+            node = root.get(tokens[start])
+            position = start + 1
+            while node is not None:
+                merchant_ids = node.get(_TERMINAL)
+                if merchant_ids and position - start > best_length:
+                    best = next(iter(merchant_ids))
+                    best_length = position - start
+                if position == len(tokens):
+                    break
+                node = node.get(tokens[position])
+                position += 1
+
+        if len(self._memo) >= _MEMO_SIZE:
+            self._memo.clear()
+        self._memo[descriptor] = best, best_length
+        return best, best_length
+
+    def _insert(self, tokens: tuple[str, ...], merchant_id: UUID):
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        merchant_ids = node.setdefault(_TERMINAL, {})
+        merchant_ids[merchant_id] = merchant_ids.get(merchant_id, 0) + 1
+        self._memo.clear()
+
+    def _remove(self, tokens: tuple[str, ...], merchant_id: UUID):
+        path = [self._root]
+        for token in tokens:
+            node = path[-1].get(token)
+            if node is None:
+                return
+            path.append(node)
+
+        merchant_ids = path[-1].get(_TERMINAL, {})
+        if merchant_id not in merchant_ids:
+            return
+
+        merchant_ids[merchant_id] -= 1
+        if merchant_ids[merchant_id] == 0:
+            del merchant_ids[merchant_id]
+        if merchant_ids:
+            self._memo.clear()
+            return
+
+        del path[-1][_TERMINAL]
+        for depth in range(len(tokens), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][tokens[depth - 1]]
+        self._memo.clear()
+
+
+merchant_matcher = MerchantMatcher()
@@ -0,0 +1,40 @@
+"""In-process metrics in the Prometheus text format"""
+from collections import Counter
+
+# Queries canceled by statement_timeout and by client disconnects, by route
+statement_timeouts: Counter[str] = Counter()
+client_cancellations: Counter[str] = Counter()
+
+# Requests rejected by the rate limiter, by route
+rate_limited: Counter[str] = Counter()
+
+_COUNTERS = {
+    "budgeter_statement_timeouts_total": statement_timeouts,
+    "budgeter_client_cancellations_total": client_cancellations,
+    "budgeter_rate_limited_total": rate_limited,
+}
+
+
+def route_name(scope) -> str:
+    """
+    Name a request by its method and route template, as in "GET /api/budgets/".
+    Routes of included routers only know their path below the including router,
+    so the leading segments of the request path make up the prefix.
+    """
+    route = scope.get("route")
+    if route is None:
+        return f"{scope['method']} {scope['path']}"
+
+    segments = scope["path"].split("/")
+    prefix = "/".join(segments[: len(segments) - route.path.count("/")])
+    return f"{scope['method']} {prefix}{route.path}"
+
+
+def render() -> str:
+    """Render every counter of this process"""
+    lines = []
+    for name, counter in _COUNTERS.items():
+        lines.append(f"# TYPE {name} counter")
+        for route, value in sorted(counter.items()):
+            lines.append(f'{name}{{route="{route}"}} {value}')
+    return "\n".join(lines) + "\n"
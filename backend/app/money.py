@@ -0,0 +1,69 @@
+"""Money amounts stored and processed as integer cents"""
+from decimal import Decimal
+from typing import Annotated
+
+from pydantic import BeforeValidator, PlainSerializer, WithJsonSchema
+
+_AMOUNT_SCHEMA = {"type": "string", "pattern": r"^-?\d+(\.\d{1,2})?$"}
+
+# Amounts are stored in bigint columns
+_MAX_CENTS = 2**63 - 1
+_MIN_CENTS = -(2**63)
+
+
+def parse_cents(value) -> int:
+    """Parse an amount in currency units, such as "12.34" or 12, into cents"""
+    cents = _to_cents(value)
+    if not _MIN_CENTS <= cents <= _MAX_CENTS:
+        raise ValueError("amount is too large")
+    return cents
+
+
+def _to_cents(value) -> int:
+    if isinstance(value, bool):
+        raise ValueError("amount must be a number")
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, Decimal):
+        if not value.is_finite():
+            raise ValueError("amount must be a number")
+        cents = value * 100
+        if cents != cents.to_integral_value():
+            raise ValueError("amount can have at most two decimal places")
+        return int(cents)
+    if isinstance(value, float):
+        value = repr(value)
+    if not isinstance(value, str):
+        raise ValueError("amount must be a number")
+
+    text = value.strip()
+    sign = -1 if text.startswith("-") else 1
+    if text[:1] in ("+", "-"):
+        text = text[1:]
+    whole, _, fraction = text.partition(".")
+    digits = whole + fraction
+    if not digits.isdigit() or not digits.isascii() or len(fraction) > 2:
+        raise ValueError("amount must be a number with at most two decimal places")
+    return sign * (int(whole or "0") * 100 + int(fraction.ljust(2, "0")))
+
+
+def format_cents(cents: int) -> str:
+    """Format cents as an exact decimal string in currency units"""
+    whole, fraction = divmod(abs(cents), 100)
+    return f"{'-' if cents < 0 else ''}{whole}.{fraction:02d}"
+
+
+# Amount given in currency units, validated into cents
+MoneyIn = Annotated[
+    int,
+    BeforeValidator(parse_cents),
+    PlainSerializer(format_cents, return_type=str, when_used="json"),
+    WithJsonSchema(_AMOUNT_SCHEMA),
+]
+
+# Amount already held in cents, serialized in currency units
+MoneyOut = Annotated[
+    int,
+    PlainSerializer(format_cents, return_type=str, when_used="json"),
+    WithJsonSchema(_AMOUNT_SCHEMA),
+]
@@ -0,0 +1,224 @@
+"""
+Opt-in request profiling. Nothing is installed and the decorators return their
+function unchanged unless PROFILING_ENABLED is set.
+
+A profile records the wall-clock time of one request split into nested spans:
+auth, bcrypt, each repository query, the endpoint and the serialization of its
+return value. Profiles are kept in a ring buffer and rendered in the folded stack
+format read by flamegraph.pl and speedscope.
+"""
+import functools
+import hmac
+import inspect
+import random
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+import fastapi
+from fastapi.routing import APIRoute
+
+from app import metrics
+from app.config import (
+    ADMIN_TOKEN,
+    PROFILING_BUFFER_SIZE,
+    PROFILING_ENABLED,
+    PROFILING_SAMPLE_RATE,
+)
+from app.slow_queries import SlowQueryCursor, repository_method
+
+_current: ContextVar["Profile | None"] = ContextVar("profile", default=None)
+
+# Profiles of the most recent profiled requests of this process
+profiles: deque["Profile"] = deque(maxlen=PROFILING_BUFFER_SIZE)
+
+
+class Profile:
+    """Self time of each stack of spans during one request"""
+
+    __slots__ = ("route", "stacks", "_open")
+
+    def __init__(self):
+        self.route = ""
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        # [name, start, time spent in child spans] of each open span, outermost first
+        self._open: list[list] = []
+
+    def enter(self, name: str):
+        """Open a span nested in the current one"""
+        self._open.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        """Close the current span"""
+        name, start, child_time = self._open.pop()
+        elapsed = time.perf_counter() - start
+        self.stacks[tuple(span[0] for span in self._open) + (name,)] += (
+            elapsed - child_time
+        )
+        if self._open:
+            self._open[-1][2] += elapsed
+
+    def exit_if(self, name: str):
+        """Close the current span if it has the given name"""
+        if len(self._open) > 1 and self._open[-1][0] == name:
+            self.exit()
+
+    def folded(self) -> dict[str, float]:
+        """Self time of each stack, with the route as the outermost frame"""
+        return {
+            ";".join((self.route,) + stack[1:]): seconds
+            for stack, seconds in self.stacks.items()
+        }
+
+
+class span:
+    """Time a block as a child of the current span when the request is profiled"""
+
+    __slots__ = ("name", "_profile")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._profile = _current.get()
+        if self._profile is not None:
+            self._profile.enter(self.name)
+
+    def __exit__(self, *exc_info):
+        if self._profile is not None:
+            self._profile.exit()
+
+
+def profiled(name: str):
+    """Time each call to the decorated function as a span"""
+
+    def decorator(func):
+        if not PROFILING_ENABLED:
+            return func
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _query_span_name() -> str:
+    """Name a query after the repository method that ran it"""
+    method = repository_method()
+    return f"db:{method}" if method else "db"
+
+
+class ProfiledCursor(SlowQueryCursor):
+    """Cursor timing each statement, used by the pools when profiling is enabled"""
+
+    async def execute(self, *args, **kwargs):
+        with span(_query_span_name()):
+            return await super().execute(*args, **kwargs)
+
+    async def executemany(self, *args, **kwargs):
+        with span(_query_span_name()):
+            return await super().executemany(*args, **kwargs)
+
+
+def _profile_endpoint(endpoint):
+    """
+    Time an endpoint and open the serialize span when it returns. The span is
+    closed when the response starts.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        with span("endpoint"):
+            result = await endpoint(*args, **kwargs)
+
+        profile = _current.get()
+        if profile is not None:
+            profile.enter("serialize")
+        return result
+
+    return wrapper
+
+
+def _is_forced(scope) -> bool:
+    """The request carries the admin token"""
+    if not ADMIN_TOKEN:
+        return False
+
+    for name, value in scope["headers"]:
+        if name == b"x-admin-token":
+            return hmac.compare_digest(value, ADMIN_TOKEN.encode())
+    return False
+
+
+class ProfilingMiddleware:
+    """Profile a sampled fraction of requests and requests with the admin token"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (
+            random.random() < PROFILING_SAMPLE_RATE or _is_forced(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.exit_if("serialize")
+            await send(message)
+
+        token = _current.set(profile)
+        profile.enter("request")
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            while profile._open:
+                profile.exit()
+            _current.reset(token)
+            profile.route = metrics.route_name(scope)
+            profiles.append(profile)
+
+
+class ProfiledRoute(APIRoute):
+    """Route class of the routers. Times the endpoint when profiling is enabled."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if PROFILING_ENABLED and inspect.iscoroutinefunction(endpoint):
+            endpoint = _profile_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+def install(app: fastapi.FastAPI):
+    """Profile requests to the app"""
+    app.add_middleware(ProfilingMiddleware)
+
+
+def render(route: str | None = None) -> str:
+    """
+    Render the buffered profiles in the folded stack format, with the total self
+    time of each stack in microseconds
+    """
+    totals: Counter[str] = Counter()
+    for profile in list(profiles):
+        if route is None or profile.route == route:
+            totals.update(profile.folded())
+    return "".join(
+        f"{stack} {round(seconds * 1_000_000)}\n"
+        for stack, seconds in sorted(totals.items())
+    )
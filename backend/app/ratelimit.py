@@ -0,0 +1,153 @@
+"""Token bucket rate limiting of routes doing bcrypt work"""
+import math
+import time
+
+import fastapi
+import psycopg_pool
+
+from app import metrics
+from app.cache import LRUCache
+from app.config import RATE_LIMIT_BACKEND, RATE_LIMIT_CACHE_SIZE, RATE_LIMITS
+
+RATE_LIMITED = {"message": "Too many requests, try again later"}
+
+# Longest key part taken from the request
+_MAX_IDENTITY_LENGTH = 256
+
+# A bucket untouched for this many seconds is full again and can be dropped
+_BUCKET_EXPIRY = max(
+    capacity / rate
+    for limits in RATE_LIMITS.values()
+    for capacity, rate in limits.values()
+)
+_SHARED_CLEANUP_INTERVAL = 1000
+
+_buckets = LRUCache(RATE_LIMIT_CACHE_SIZE)
+_shared_acquisitions = 0
+
+_ACQUIRE_SQL = (
+    "INSERT INTO rate_limit_bucket AS b (key, tokens, updated) "
+    "VALUES (%(key)s, %(capacity)s - 1, now()) "
+    "ON CONFLICT (key) DO UPDATE SET "
+    "  tokens = least("
+    "    %(capacity)s, b.tokens + extract(epoch FROM now() - b.updated) * %(rate)s"
+    "  ) - 1, "
+    "  updated = now() "
+    "WHERE least("
+    "  %(capacity)s, b.tokens + extract(epoch FROM now() - b.updated) * %(rate)s"
+    ") >= 1 "
+    "RETURNING tokens;"
+)
+_RETRY_AFTER_SQL = (
+    "SELECT (1 - least("
+    "  %(capacity)s, tokens + extract(epoch FROM now() - updated) * %(rate)s"
+    ")) / %(rate)s "
+    "FROM rate_limit_bucket WHERE key = %(key)s;"
+)
+
+
+def _acquire_local(key: str, capacity: int, rate: float) -> float:
+    """
+    Take a token from a bucket of this process. Returns 0 on success or the seconds
+    until a token is available.
+    """
+    now = time.monotonic()
+    tokens, updated = _buckets.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens < 1:
+        _buckets.set(key, (tokens, now))
+        return (1 - tokens) / rate
+
+    _buckets.set(key, (tokens - 1, now))
+    return 0.0
+
+
+async def _acquire_shared(
+    pool: psycopg_pool.AsyncConnectionPool, key: str, capacity: int, rate: float
+) -> float:
+    """Take a token from a bucket shared by every worker through Postgres"""
+    global _shared_acquisitions
+    _shared_acquisitions += 1
+
+    params = {"key": key, "capacity": capacity, "rate": rate}
+    async with pool.connection() as conn:
+        cursor = await conn.execute(_ACQUIRE_SQL, params)
+        if await cursor.fetchone() is not None:
+            retry_after = 0.0
+        else:
+            cursor = await conn.execute(_RETRY_AFTER_SQL, params)
+            row = await cursor.fetchone()
+            retry_after = max(row[0], 0.0) if row else 0.0
+
+        if _shared_acquisitions % _SHARED_CLEANUP_INTERVAL == 0:
+            await conn.execute(
+                "DELETE FROM rate_limit_bucket "
+                "WHERE updated < now() - make_interval(secs => %s);",
+                (_BUCKET_EXPIRY,),
+            )
+
+    return retry_after
+
+
+async def _username(request: fastapi.Request) -> str | None:
+    """
+    Get the username from the form or JSON body. The route has already read the
+    body, so this does not read it again.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(
+        ("application/x-www-form-urlencoded", "multipart/form-data")
+    ):
+        username = (await request.form()).get("username")
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        username = body.get("username") if isinstance(body, dict) else None
+
+    if not isinstance(username, str):
+        return None
+    return username.casefold()[:_MAX_IDENTITY_LENGTH]
+
+
+async def rate_limit(request: fastapi.Request):
+    """
+    Take a token for the client IP and for the username from the route's buckets
+    in RATE_LIMITS. Added as a route dependency so it runs before the connection
+    is checked out and any password is hashed.
+
+    Every worker keeps its own buckets, which reject a burst without touching the
+    database. With RATE_LIMIT_BACKEND "postgres" a token must also be available in
+    the bucket shared by all workers.
+    """
+    route_name = metrics.route_name(request.scope)
+    limits = RATE_LIMITS.get(route_name)
+    if limits is None:
+        return
+
+    identities = {
+        "ip": request.client.host if request.client else None,
+        "username": await _username(request),
+    }
+    pool = None
+    if RATE_LIMIT_BACKEND == "postgres":
+        pool = getattr(request.app, "conn_pool", None)
+
+    for kind, (capacity, rate) in limits.items():
+        identity = identities.get(kind)
+        if identity is None:
+            continue
+
+        key = f"{route_name} {kind}:{identity}"
+        retry_after = _acquire_local(key, capacity, rate)
+        if not retry_after and pool is not None:
+            retry_after = await _acquire_shared(pool, key, capacity, rate)
+
+        if retry_after:
+            metrics.rate_limited[route_name] += 1
+            raise fastapi.HTTPException(
+                status_code=fastapi.status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=RATE_LIMITED,
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
@@ -1,8 +1,9 @@
 """Contains all routers"""
 import fastapi
 
-from app.routers import api
+from app.routers import api, health
 
 router = fastapi.APIRouter()
 
 router.include_router(api.router)
+router.include_router(health.router)
@@ -0,0 +1,39 @@
+"""Operator routes"""
+from typing import Annotated
+
+import fastapi
+from fastapi.responses import PlainTextResponse
+
+from app import profiling, slow_queries
+from app.auth import verify_admin_token
+from app.profiling import ProfiledRoute
+
+router = fastapi.APIRouter(
+    prefix="/admin",
+    dependencies=[fastapi.Depends(verify_admin_token)],
+    tags=["Admin"],
+    route_class=ProfiledRoute,
+)
+
+
+@router.get("/profiles", response_class=PlainTextResponse)
+async def get_profiles(
+    route: Annotated[str | None, fastapi.Query(max_length=200)] = None
+):
+    """
+    Buffered request profiles of this worker in the folded stack format, optionally
+    for a single route such as "GET /api/transactions/"
+    """
+    return profiling.render(route)
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    caller: Annotated[str | None, fastapi.Query(max_length=200)] = None
+) -> list[dict]:
+    """
+    Slow queries captured by this worker, newest first, optionally of a single
+    repository method such as "TransactionRepository.list". Plans captured in the
+    background show up once their status is "captured".
+    """
+    return slow_queries.recent(caller)
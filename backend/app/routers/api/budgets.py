@@ -1,30 +1,97 @@
 """Budget routes"""
+import datetime
 from uuid import UUID
 
 import fastapi
 
-from app.auth import CurrentActiveUser
-from app.db import Connection
-from app.db.budget import BudgetRepository
-from app.serializers import BudgetEdit, BudgetIn, BudgetOut
+from app.auth import CurrentActiveUser, UserConnection
+from app.conditional import not_modified
+from app.db import Repositories
+from app.profiling import ProfiledRoute
+from app.serializers import BudgetEdit, BudgetHistoryOut, BudgetIn, BudgetOut
 
-router = fastapi.APIRouter(prefix="/budgets", tags=["Budget"])
+router = fastapi.APIRouter(
+    prefix="/budgets", tags=["Budget"], route_class=ProfiledRoute
+)
+
+# Longest budget history returned by one request
+MAX_HISTORY_MONTHS = 120
+
+
+def _month_start(date: datetime.date | None = None) -> datetime.date:
+    """First day of the month of date, by default the current month"""
+    return (date or datetime.date.today()).replace(day=1)
+
+
+def _add_months(date: datetime.date, months: int) -> datetime.date:
+    """First day of the month months after the month of date"""
+    month = date.year * 12 + date.month - 1 + months
+    return datetime.date(month // 12, month % 12 + 1, 1)
 
 
 @router.get("/")
-async def get_all_budgets(conn: Connection, user: CurrentActiveUser) -> list[BudgetOut]:
-    """Get all budget items for the logged in user"""
-    budget_repo = BudgetRepository(conn)
-    return await budget_repo.list(user.id)
+async def get_all_budgets(
+    request: fastapi.Request,
+    response: fastapi.Response,
+    conn: UserConnection,
+    repos: Repositories,
+    user: CurrentActiveUser,
+    on: datetime.date | None = None,
+) -> list[BudgetOut]:
+    """
+    Get all budget periods for the logged in user, or the ones in effect on a
+    date. Answers 304 when the client's copy is current.
+    """
+    budget_repo = repos.budget(conn)
+    version, modified = await budget_repo.get_data_version(user.id)
+    cached = not_modified(request, response, user.id, version, modified)
+    if cached is not None:
+        return cached
+
+    return await budget_repo.list(user.id, on=on)
+
+
+@router.get("/history")
+async def get_budget_history(
+    conn: UserConnection,
+    repos: Repositories,
+    user: CurrentActiveUser,
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+) -> list[BudgetHistoryOut]:
+    """
+    Get the budgeted and spent amount of each category for each month from the
+    month of start to the month of end. Defaults to the last 12 months.
+    """
+    stop = _add_months(end or datetime.date.today(), 1)
+    start = _month_start(start) if start else _add_months(stop, -12)
+    if not start < stop or stop > _add_months(start, MAX_HISTORY_MONTHS):
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={
+                "message": "start must be before end and at most "
+                f"{MAX_HISTORY_MONTHS} months apart"
+            },
+        )
+
+    budget_repo = repos.budget(conn)
+    return await budget_repo.history(user.id, start, stop)
 
 
 @router.post("/", status_code=fastapi.status.HTTP_201_CREATED)
 async def create_budget(
-    conn: Connection, user: CurrentActiveUser, budget: BudgetIn
+    conn: UserConnection, repos: Repositories, user: CurrentActiveUser, budget: BudgetIn
 ) -> BudgetOut:
-    """Create new budget item"""
-    budget_repo = BudgetRepository(conn)
+    """Create new budget item. The period starts this month unless given."""
+    budget_repo = repos.budget(conn)
     model = budget.model_dump()
+    model["start"] = model["start"] or _month_start()
+    if model["end"] is not None and model["end"] <= model["start"]:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"message": "end must be after start"},
+        )
+
     model["id"] = await budget_repo.create(user_id=user.id, **model)
     return model
 
@@ -37,18 +104,29 @@ async def edit_budget(
     budget_id: UUID,
     budget: BudgetEdit,
     user: CurrentActiveUser,
-    conn: Connection,
+    conn: UserConnection,
+    repos: Repositories,
 ):
-    """Update amount on budget item"""
-    budget_repo = BudgetRepository(conn)
-    await budget_repo.update(amount=budget.amount, budget_id=budget_id, user_id=user.id)
+    """
+    Update amount on budget item from the effective date, this month unless given.
+    The previous amount is kept in the budget history.
+    """
+    budget_repo = repos.budget(conn)
+    await budget_repo.update(
+        amount=budget.amount,
+        budget_id=budget_id,
+        user_id=user.id,
+        effective=budget.effective or _month_start(),
+    )
 
 
 @router.delete(
     "/{budget_id}",
     status_code=fastapi.status.HTTP_204_NO_CONTENT,
 )
-async def delete_budget(budget_id: UUID, user: CurrentActiveUser, conn: Connection):
+async def delete_budget(
+    budget_id: UUID, user: CurrentActiveUser, conn: UserConnection, repos: Repositories
+):
     """Delete budget item"""
-    budget_repo = BudgetRepository(conn)
+    budget_repo = repos.budget(conn)
     await budget_repo.delete(budget_id=budget_id, user_id=user.id)
@@ -2,28 +2,33 @@
 import fastapi
 
 from app.auth import get_current_active_user
-from app.db import Connection
-from app.db.category import CategoryRepository
+from app.db import Connection, Repositories
+from app.profiling import ProfiledRoute
 from app.serializers import CategoryIn, CategoryOut
 
 router = fastapi.APIRouter(
     prefix="/categories",
     dependencies=[fastapi.Depends(get_current_active_user)],
     tags=["Category"],
+    route_class=ProfiledRoute,
 )
 
 
 @router.get("/")
-async def get_all_categories(conn: Connection) -> list[CategoryOut]:
+async def get_all_categories(
+    conn: Connection, repos: Repositories
+) -> list[CategoryOut]:
     """Get all Categories"""
-    category_repo = CategoryRepository(conn)
+    category_repo = repos.category(conn)
     return await category_repo.list()
 
 
 @router.post("/", status_code=fastapi.status.HTTP_201_CREATED)
-async def create_category(conn: Connection, category: CategoryIn) -> CategoryOut:
+async def create_category(
+    conn: Connection, repos: Repositories, category: CategoryIn
+) -> CategoryOut:
     """Create new Category"""
-    category_repo = CategoryRepository(conn)
+    category_repo = repos.category(conn)
     model = category.model_dump()
     model["id"] = await category_repo.create(category.name)
     return model
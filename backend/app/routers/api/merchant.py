@@ -1,29 +1,88 @@
 """Merchant routes routes"""
+from typing import Annotated
+from uuid import UUID
+
 import fastapi
 
-from app.auth import get_current_active_user
-from app.db import Connection
-from app.db.merchant import MerchantRepository
-from app.serializers import MerchantIn, MerchantOut
+from app.auth import CurrentActiveUser, UserConnection, get_current_active_user
+from app.db import Connection, Repositories
+from app.profiling import ProfiledRoute
+from app.serializers import (
+    DescriptorMatchIn,
+    DescriptorMatchOut,
+    MerchantAliasIn,
+    MerchantAliasOut,
+    MerchantIn,
+    MerchantOut,
+)
 
 router = fastapi.APIRouter(
     prefix="/merchants",
     dependencies=[fastapi.Depends(get_current_active_user)],
     tags=["Merchant"],
+    route_class=ProfiledRoute,
 )
 
 
 @router.get("/")
-async def get_all_merchants(conn: Connection) -> list[MerchantOut]:
+async def get_all_merchants(conn: Connection, repos: Repositories) -> list[MerchantOut]:
     """get all merchants"""
-    merchant_repo = MerchantRepository(conn)
+    merchant_repo = repos.merchant(conn)
     return await merchant_repo.list()
 
 
+@router.get("/search")
+async def search_merchants(
+    conn: UserConnection,
+    repos: Repositories,
+    user: CurrentActiveUser,
+    q: Annotated[str, fastapi.Query(min_length=1, max_length=100)],
+    limit: Annotated[int, fastapi.Query(ge=1, le=50)] = 10,
+) -> list[MerchantOut]:
+    """Search merchants by name for autocomplete"""
+    merchant_repo = repos.merchant(conn)
+    return await merchant_repo.search(q, user.id, limit=limit)
+
+
 @router.post("/")
-async def create_merchant(conn: Connection, merchant: MerchantIn) -> MerchantOut:
+async def create_merchant(
+    conn: Connection, repos: Repositories, merchant: MerchantIn
+) -> MerchantOut:
     """Create new merchant"""
-    merchant_repo = MerchantRepository(conn)
+    merchant_repo = repos.merchant(conn)
     model = merchant.model_dump()
     model["id"] = await merchant_repo.create(merchant.name)
     return model
+
+
+@router.post("/{merchant_id}/aliases", status_code=fastapi.status.HTTP_201_CREATED)
+async def create_merchant_alias(
+    conn: Connection,
+    repos: Repositories,
+    user: CurrentActiveUser,
+    merchant_id: UUID,
+    alias: MerchantAliasIn,
+) -> MerchantAliasOut:
+    """Create new descriptor alias for a merchant, matching for the current user"""
+    merchant_repo = repos.merchant(conn)
+    model = alias.model_dump()
+    model["merchant_id"] = merchant_id
+    model["id"] = await merchant_repo.create_alias(alias.pattern, merchant_id, user.id)
+    return model
+
+
+@router.post("/match")
+async def match_descriptors(
+    conn: Connection,
+    repos: Repositories,
+    user: CurrentActiveUser,
+    descriptors: DescriptorMatchIn,
+) -> list[DescriptorMatchOut]:
+    """Match raw bank descriptors of the current user to merchants"""
+    merchant_repo = repos.merchant(conn)
+    matcher = await merchant_repo.get_matcher()
+    merchant_ids = matcher.match_many(descriptors.descriptors, user.id)
+    return [
+        {"descriptor": descriptor, "merchant_id": merchant_id}
+        for descriptor, merchant_id in zip(descriptors.descriptors, merchant_ids)
+    ]
@@ -5,19 +5,22 @@ import fastapi
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app.auth import authenticate_user, create_access_token
-from app.db import Connection
+from app.db import Connection, Repositories
+from app.profiling import ProfiledRoute
+from app.ratelimit import rate_limit
 from app.serializers import TokenResponse
 
-router = fastapi.APIRouter(prefix="/token", tags=["Token"])
+router = fastapi.APIRouter(prefix="/token", tags=["Token"], route_class=ProfiledRoute)
 
 
-@router.post("/")
+@router.post("/", dependencies=[fastapi.Depends(rate_limit)])
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, fastapi.Depends()],
     conn: Connection,
+    repos: Repositories,
 ) -> TokenResponse:
     """Get access token"""
-    user = await authenticate_user(conn, form_data.username, form_data.password)
+    user = await authenticate_user(conn, repos, form_data.username, form_data.password)
 
     if user is None:
         raise fastapi.HTTPException(
@@ -1,27 +1,107 @@
 """Transactions route"""
 import datetime
+from collections import Counter
+from typing import Annotated
 from uuid import UUID
 
 import fastapi
+from psycopg import AsyncConnection
 
-from app.auth import CurrentActiveUser
-from app.db import Connection
-from app.db.transaction import TransactionRepository
-from app.serializers import TransactionIn, TransactionOut
+from app.auth import CurrentActiveUser, UserConnection
+from app.conditional import not_modified
+from app.config import CATEGORY_SUGGESTION_MIN_CONFIDENCE
+from app.db import Repositories, RepositorySet, primary_connection
+from app.matcher import MerchantMatcher, normalize
+from app.profiling import ProfiledRoute
+from app.serializers import (
+    CategorySuggestionIn,
+    CategorySuggestionOut,
+    TransactionImportOut,
+    TransactionIn,
+    TransactionOut,
+    UserInDB,
+)
+from app.suggest import CategoryModel
 
-router = fastapi.APIRouter(prefix="/transactions", tags=["Transaction"])
+router = fastapi.APIRouter(
+    prefix="/transactions", tags=["Transaction"], route_class=ProfiledRoute
+)
+
+NO_CATEGORY_SUGGESTION = {
+    "message": "category_id is required, no confident suggestion could be made"
+}
+
+# Most transactions imported by one request
+MAX_IMPORT_ROWS = 10000
+
+
+def _suggest_category(
+    model: CategoryModel, matcher: MerchantMatcher, transaction: TransactionIn
+) -> UUID | None:
+    """Get the suggested category of a transaction if the suggestion is confident"""
+    category_id, confidence = model.suggest(
+        transaction.merchant_id,
+        transaction.amount,
+        matcher.name_tokens(transaction.merchant_id),
+    )
+    if category_id is None or confidence < CATEGORY_SUGGESTION_MIN_CONFIDENCE:
+        return None
+    return category_id
+
+
+async def _get_matcher(
+    request: fastapi.Request, repos: RepositorySet
+) -> MerchantMatcher:
+    """Get the merchant matcher without holding a primary connection"""
+    async with primary_connection(request) as conn:
+        return await repos.merchant(conn).get_matcher()
+
+
+async def _resolve_category(
+    request: fastapi.Request,
+    user_conn: AsyncConnection,
+    repos: RepositorySet,
+    user: UserInDB,
+    transaction: TransactionIn,
+) -> UUID:
+    """Use the given category or fill in a confident suggestion"""
+    if transaction.category_id is not None:
+        return transaction.category_id
+
+    transaction_repo = repos.transaction(user_conn)
+    model = await transaction_repo.get_category_model(user.id)
+    matcher = await _get_matcher(request, repos)
+    category_id = _suggest_category(model, matcher, transaction)
+    if category_id is None:
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=NO_CATEGORY_SUGGESTION,
+        )
+
+    return category_id
 
 
 @router.get("/")
 async def get_all_transactions(
-    conn: Connection,
+    request: fastapi.Request,
+    response: fastapi.Response,
+    conn: UserConnection,
+    repos: Repositories,
     user: CurrentActiveUser,
     prev_date: datetime.date | None = None,
     prev_id: UUID | None = None,
     limit: int = 50,
 ) -> list[TransactionOut]:
-    """Get all transactions for the current user"""
-    transaction_repo = TransactionRepository(conn)
+    """
+    Get all transactions for the current user. Answers 304 when the client's copy
+    is current.
+    """
+    transaction_repo = repos.transaction(conn)
+    version, modified = await transaction_repo.get_data_version(user.id)
+    cached = not_modified(request, response, user.id, version, modified)
+    if cached is not None:
+        return cached
+
     return await transaction_repo.list(
         user.id, prev_date=prev_date, prev_id=prev_id, limit=limit
     )
@@ -29,46 +109,142 @@ async def get_all_transactions(
 
 @router.post("/", status_code=fastapi.status.HTTP_201_CREATED)
 async def create_transaction(
-    conn: Connection, user: CurrentActiveUser, transaction: TransactionIn
+    request: fastapi.Request,
+    user_conn: UserConnection,
+    repos: Repositories,
+    user: CurrentActiveUser,
+    transaction: TransactionIn,
 ) -> TransactionOut:
-    """Create new transaction"""
-    transaction_repo = TransactionRepository(conn)
+    """
+    Create new transaction. A missing category is filled in when confident. An
+    equal transaction is refused unless given a higher occurrence.
+    """
+    transaction_repo = repos.transaction(user_conn)
     model = transaction.model_dump()
+    model["category_id"] = await _resolve_category(
+        request, user_conn, repos, user, transaction
+    )
+    model["occurrence"] = transaction.occurrence or 1
     model["id"] = await transaction_repo.create(
         transaction.amount,
         transaction.date,
         transaction.merchant_id,
-        transaction.category_id,
+        model["category_id"],
         user.id,
+        model["occurrence"],
     )
     return model
 
 
+@router.post("/import")
+async def import_transactions(
+    request: fastapi.Request,
+    user_conn: UserConnection,
+    repos: Repositories,
+    user: CurrentActiveUser,
+    transactions: Annotated[
+        list[TransactionIn], fastapi.Body(max_length=MAX_IMPORT_ROWS)
+    ],
+) -> TransactionImportOut:
+    """
+    Import a batch of transactions, such as a bank statement, skipping the ones
+    imported before. Equal rows without an occurrence are numbered in the order
+    given, so overlapping statements can be imported again. Missing categories are
+    filled in when confident.
+    """
+    transaction_repo = repos.transaction(user_conn)
+    rows = [transaction.model_dump() for transaction in transactions]
+    if any(row["category_id"] is None for row in rows):
+        model = await transaction_repo.get_category_model(user.id)
+        matcher = await _get_matcher(request, repos)
+        for index, (row, transaction) in enumerate(zip(rows, transactions)):
+            if row["category_id"] is None:
+                row["category_id"] = _suggest_category(model, matcher, transaction)
+            if row["category_id"] is None:
+                raise fastapi.HTTPException(
+                    status_code=fastapi.status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail={**NO_CATEGORY_SUGGESTION, "index": index},
+                )
+
+    occurrences: Counter[tuple] = Counter()
+    for row in rows:
+        if row["occurrence"] is None:
+            key = (row["date"], row["amount"], row["merchant_id"])
+            occurrences[key] += 1
+            row["occurrence"] = occurrences[key]
+
+    transaction_ids = await transaction_repo.create_many(rows, user.id)
+    created, skipped = [], []
+    for index, (row, transaction_id) in enumerate(zip(rows, transaction_ids)):
+        if transaction_id is None:
+            skipped.append(index)
+        else:
+            created.append({**row, "id": transaction_id})
+
+    return {"created": created, "skipped": skipped}
+
+
+@router.post("/suggest")
+async def suggest_categories(
+    request: fastapi.Request,
+    user_conn: UserConnection,
+    repos: Repositories,
+    user: CurrentActiveUser,
+    transactions: list[CategorySuggestionIn],
+) -> list[CategorySuggestionOut]:
+    """
+    Suggest categories for a batch of transactions. Transactions without a
+    merchant_id are matched to a merchant by their descriptor.
+    """
+    transaction_repo = repos.transaction(user_conn)
+    model = await transaction_repo.get_category_model(user.id)
+    matcher = await _get_matcher(request, repos)
+    suggestions = []
+    for transaction in transactions:
+        merchant_id = transaction.merchant_id
+        if merchant_id is None and transaction.descriptor:
+            merchant_id = matcher.match(transaction.descriptor, user.id)
+
+        if transaction.descriptor:
+            tokens = normalize(transaction.descriptor)
+        else:
+            tokens = matcher.name_tokens(merchant_id)
+
+        category_id, confidence = model.suggest(merchant_id, transaction.amount, tokens)
+        suggestions.append({"category_id": category_id, "confidence": confidence})
+
+    return suggestions
+
+
 @router.put("/{transaction_id}", status_code=fastapi.status.HTTP_204_NO_CONTENT)
 async def edit_transaction(
-    conn: Connection,
+    request: fastapi.Request,
+    user_conn: UserConnection,
+    repos: Repositories,
     user: CurrentActiveUser,
     transaction_id: UUID,
     transaction: TransactionIn,
 ):
     """Edit transaction"""
-    transaction_repo = TransactionRepository(conn)
+    transaction_repo = repos.transaction(user_conn)
     await transaction_repo.update(
         transaction_id,
         transaction.amount,
         transaction.date,
         transaction.merchant_id,
-        transaction.category_id,
+        await _resolve_category(request, user_conn, repos, user, transaction),
         user.id,
+        transaction.occurrence,
     )
 
 
 @router.delete("/{transaction_id}", status_code=fastapi.status.HTTP_204_NO_CONTENT)
 async def delete_transaction(
-    conn: Connection,
+    conn: UserConnection,
+    repos: Repositories,
     user: CurrentActiveUser,
     transaction_id: UUID,
 ):
     """Delete transaction"""
-    transaction_repo = TransactionRepository(conn)
+    transaction_repo = repos.transaction(conn)
     await transaction_repo.delete(transaction_id, user.id)
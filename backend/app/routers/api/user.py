@@ -2,17 +2,22 @@
 import fastapi
 
 from app.auth import get_password_hash
-from app.db import Connection
-from app.db.user import UserRepository
+from app.db import Connection, Repositories
+from app.profiling import ProfiledRoute
+from app.ratelimit import rate_limit
 from app.serializers import UserSignUp
 
-router = fastapi.APIRouter(prefix="/user", tags=["User"])
+router = fastapi.APIRouter(prefix="/user", tags=["User"], route_class=ProfiledRoute)
 
 
-@router.post("/", status_code=fastapi.status.HTTP_201_CREATED)
-async def user_sign_up(conn: Connection, user_info: UserSignUp):
+@router.post(
+    "/",
+    status_code=fastapi.status.HTTP_201_CREATED,
+    dependencies=[fastapi.Depends(rate_limit)],
+)
+async def user_sign_up(conn: Connection, repos: Repositories, user_info: UserSignUp):
     """New user sign up"""
     hashed_password = get_password_hash(user_info.password)
-    user_repo = UserRepository(conn)
+    user_repo = repos.user(conn)
     await user_repo.create(user_info.username, user_info.email, hashed_password)
     return {"message": "sign up successful. Proceed to login."}
@@ -0,0 +1,31 @@
+"""Health check routes"""
+import fastapi
+from fastapi.responses import PlainTextResponse
+
+from app import metrics
+from app.profiling import ProfiledRoute
+
+router = fastapi.APIRouter(prefix="/health", tags=["Health"], route_class=ProfiledRoute)
+
+
+@router.get("/live")
+async def liveness():
+    """The process is up and serving requests"""
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def readiness(request: fastapi.Request):
+    """The connection pool is warmed and the app is not shutting down"""
+    if not getattr(request.app, "ready", False):
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"message": "Not ready"},
+        )
+    return {"status": "ok"}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Counters of this worker process"""
+    return metrics.render()
@@ -1,9 +1,11 @@
 """FastAPI model serializers"""
 import datetime
-from decimal import Decimal
+from typing import Annotated
 from uuid import UUID
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field, model_validator
+
+from app.money import MoneyIn, MoneyOut
 
 
 class TokenResponse(BaseModel):
@@ -64,34 +66,116 @@ class MerchantOut(MerchantIn):
     id: UUID
 
 
+class MerchantAliasIn(BaseModel):
+    """User input for Merchant alias"""
+
+    pattern: str
+
+
+class MerchantAliasOut(MerchantAliasIn):
+    """Response model for Merchant alias"""
+
+    id: UUID
+    merchant_id: UUID
+
+
+class DescriptorMatchIn(BaseModel):
+    """Raw bank descriptors to match to merchants"""
+
+    descriptors: list[str]
+
+
+class DescriptorMatchOut(BaseModel):
+    """Merchant matched for a raw bank descriptor"""
+
+    descriptor: str
+    merchant_id: UUID | None
+
+
 class TransactionIn(BaseModel):
-    """User input for Transaction"""
+    """
+    User input for Transaction. occurrence numbers transactions with the same
+    date, amount and merchant, so a repeated purchase is not taken for a duplicate.
+    """
 
-    amount: Decimal
+    amount: MoneyIn
     date: datetime.date
-    category_id: UUID
+    category_id: UUID | None = None
     merchant_id: UUID
+    occurrence: Annotated[int, Field(ge=1)] | None = None
 
 
 class TransactionOut(TransactionIn):
     """Response model for Transaction"""
 
     id: UUID
+    amount: MoneyOut
+    category_id: UUID
+    occurrence: int
+
+
+class TransactionImportOut(BaseModel):
+    """Result of a bulk import, with the indexes of rows that already existed"""
+
+    created: list[TransactionOut]
+    skipped: list[int]
+
+
+class CategorySuggestionIn(BaseModel):
+    """Transaction to suggest a category for"""
+
+    amount: MoneyIn
+    merchant_id: UUID | None = None
+    descriptor: str | None = None
+
+
+class CategorySuggestionOut(BaseModel):
+    """Suggested category with a 0-1 confidence"""
+
+    category_id: UUID | None
+    confidence: float
 
 
 class BudgetEdit(BaseModel):
-    """Edit model for Budget"""
+    """
+    Edit model for Budget. The amount applies from effective, by default the first
+    day of the current month, and the previous amount is kept for the time before.
+    """
 
-    amount: Decimal
+    amount: MoneyIn
+    effective: datetime.date | None = None
 
 
-class BudgetIn(BudgetEdit):
-    """User input for Budget"""
+class BudgetIn(BaseModel):
+    """
+    User input for Budget. The period runs from start, by default the first day of
+    the current month, until the day before end or indefinitely.
+    """
 
+    amount: MoneyIn
     category_id: UUID
+    start: datetime.date | None = None
+    end: datetime.date | None = None
+
+    @model_validator(mode="after")
+    def check_period(self):
+        """The period must not be empty"""
+        if self.start and self.end and self.end <= self.start:
+            raise ValueError("end must be after start")
+        return self
 
 
 class BudgetOut(BudgetIn):
-    """Response model for Budget"""
+    """Response model for Budget. Budgets from before periods have no start."""
 
     id: UUID
+    amount: MoneyOut
+
+
+class BudgetHistoryOut(BaseModel):
+    """Budgeted and spent amount of a category in one month"""
+
+    month: datetime.date
+    category_id: UUID
+    budgeted: MoneyOut | None
+    spent: MoneyOut
@@ -0,0 +1,33 @@
+"""Production server entry point"""
+import uvicorn
+
+from app.config import (
+    GRACEFUL_SHUTDOWN_TIMEOUT,
+    SERVER_HOST,
+    SERVER_PORT,
+    WEB_CONCURRENCY,
+)
+
+
+def main():
+    """
+    Run WEB_CONCURRENCY uvicorn workers with the uvloop event loop and httptools
+    parser. On SIGTERM, workers report not ready, stop accepting connections and
+    get GRACEFUL_SHUTDOWN_TIMEOUT seconds to finish in-flight requests.
+    """
+    uvicorn.run(
+        "app.main:app_factory",
+        factory=True,
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=WEB_CONCURRENCY,
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",
+        access_log=False,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Capture of slow repository queries. A query running longer than SLOW_QUERY_MS is
+recorded with the shape of its parameters, never their values, and the repository
+method that ran it. Its plan is captured in the background on another connection
+from the same pool, inside a transaction that is rolled back, so the request is not
+delayed. Only read-only statements are run again by EXPLAIN (ANALYZE, BUFFERS),
+writes and locking reads get a plain EXPLAIN. Failed statements, including timed
+out and canceled ones, are not explained, and an explain gets at most the
+statement timeout of the connection the query ran on.
+"""
+import asyncio
+import datetime
+import re
+import sys
+import time
+import weakref
+from collections import deque
+from collections.abc import Mapping
+from pathlib import Path
+
+import psycopg
+import psycopg_pool
+from psycopg import AsyncCursor, sql
+
+from app.cache import LRUCache
+from app.config import (
+    SLOW_QUERY_BUFFER_SIZE,
+    SLOW_QUERY_EXPLAIN_INTERVAL,
+    SLOW_QUERY_EXPLAIN_TIMEOUT_MS,
+    SLOW_QUERY_MS,
+    STATEMENT_TIMEOUT_MS,
+)
+
+_DB_PACKAGE = str(Path(__file__).parent / "db")
+_EXPLAINABLE = ("select", "insert", "update", "delete", "with", "values")
+# A WITH may hold data-modifying statements, so only these are run again
+_READ_ONLY = ("select", "values")
+_LOCKING = re.compile(r"\bfor\s+(update|no\s+key\s+update|share|key\s+share)\b")
+_ANALYZE_PREFIX = "EXPLAIN (ANALYZE, BUFFERS) "
+_EXPLAIN_PREFIX = "EXPLAIN "
+# Explains running at once, further slow queries are captured without a plan
+_MAX_RUNNING_EXPLAINS = 2
+
+# Captures of the most recent slow queries of this process
+captures: deque[dict] = deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+
+# Pool of each open connection, to explain on the database the query ran on
+_pools: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+# Statement timeout of connections checked out with a non-default timeout
+_statement_timeouts: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+# When each statement was last explained
+_explained = LRUCache(1000)
+_explain_tasks: set[asyncio.Task] = set()
+
+
+def repository_method() -> str | None:
+    """Qualified name of the app.db function running the current query"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code.co_filename.startswith(_DB_PACKAGE):
+            return frame.f_code.co_qualname
+        frame = frame.f_back
+    return None
+
+
+def _shape(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def param_shapes(params) -> dict[str, str] | list[str] | None:
+    """Types of the parameters of a query, with the length of sequences"""
+    if params is None:
+        return None
+    if isinstance(params, Mapping):
+        return {name: _shape(value) for name, value in params.items()}
+    return [_shape(value) for value in params]
+
+
+async def track_connection(
+    conn: psycopg.AsyncConnection, pool: psycopg_pool.AsyncConnectionPool
+):
+    """Remember the pool of a new connection"""
+    _pools[conn] = pool
+
+
+def track_statement_timeout(conn: psycopg.AsyncConnection, timeout_ms: int | None):
+    """Remember the statement timeout of a connection, None for the default"""
+    if timeout_ms is None:
+        _statement_timeouts.pop(conn, None)
+    else:
+        _statement_timeouts[conn] = timeout_ms
+
+
+def _read_only(text: str) -> bool:
+    text = text.lstrip().lower()
+    return text.startswith(_READ_ONLY) and _LOCKING.search(text) is None
+
+
+async def _explain(
+    pool: psycopg_pool.AsyncConnectionPool,
+    capture: dict,
+    query,
+    params,
+    analyze: bool,
+    timeout_ms: int,
+):
+    prefix = _ANALYZE_PREFIX if analyze else _EXPLAIN_PREFIX
+    if isinstance(query, str):
+        explain_query = prefix + query
+    elif isinstance(query, bytes):
+        explain_query = prefix.encode() + query
+    else:
+        explain_query = sql.SQL(prefix) + query
+
+    try:
+        async with pool.connection() as conn:
+            # A plain cursor so the explain is neither captured nor profiled
+            async with conn.transaction(force_rollback=True), AsyncCursor(
+                conn
+            ) as cursor:
+                await cursor.execute(
+                    "SELECT set_config('statement_timeout', %s, true);",
+                    (str(timeout_ms),),
+                )
+                await cursor.execute(explain_query, params)
+                rows = await cursor.fetchall()
+    except (psycopg.Error, psycopg_pool.PoolTimeout) as err:
+        capture["plan_status"] = f"failed: {type(err).__name__}"
+        return
+
+    capture["plan"] = "\n".join(row[0] for row in rows)
+    capture["plan_status"] = "captured"
+
+
+class SlowQueryCursor(AsyncCursor):
+    """Cursor capturing statements slower than SLOW_QUERY_MS"""
+
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        error = None
+        try:
+            return await super().execute(query, params, **kwargs)
+        except BaseException as err:
+            error = type(err).__name__
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if SLOW_QUERY_MS and duration_ms >= SLOW_QUERY_MS:
+                self._capture(query, params, duration_ms, error)
+
+    def _capture(self, query, params, duration_ms: float, error: str | None):
+        if isinstance(query, sql.Composable):
+            text = query.as_string(self.connection)
+        elif isinstance(query, bytes):
+            text = query.decode()
+        else:
+            text = query
+
+        capture = {
+            "captured_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "duration_ms": round(duration_ms, 1),
+            "caller": repository_method(),
+            "sql": text,
+            "params": param_shapes(params),
+            "error": error,
+            "plan": None,
+            "plan_status": "skipped",
+        }
+        captures.append(capture)
+
+        pool = _pools.get(self.connection)
+        now = time.monotonic()
+        last_explained = _explained.get(text)
+        if (
+            pool is None
+            or error is not None
+            or len(_explain_tasks) >= _MAX_RUNNING_EXPLAINS
+            or not text.lstrip().lower().startswith(_EXPLAINABLE)
+            or (
+                last_explained is not None
+                and now - last_explained < SLOW_QUERY_EXPLAIN_INTERVAL
+            )
+        ):
+            return
+
+        _explained.set(text, now)
+        capture["plan_status"] = "pending"
+        timeout_ms = min(
+            SLOW_QUERY_EXPLAIN_TIMEOUT_MS,
+            _statement_timeouts.get(self.connection, STATEMENT_TIMEOUT_MS),
+        )
+        task = asyncio.create_task(
+            _explain(pool, capture, query, params, _read_only(text), timeout_ms)
+        )
+        _explain_tasks.add(task)
+        task.add_done_callback(_explain_tasks.discard)
+
+
+def recent(caller: str | None = None) -> list[dict]:
+    """Buffered captures, newest first, optionally of a single repository method"""
+    return [
+        capture
+        for capture in reversed(captures)
+        if caller is None or capture["caller"] == caller
+    ]
@@ -0,0 +1,83 @@
+"""Category suggestions from a user's transaction history"""
+import time
+from collections import Counter
+from uuid import UUID
+
+from app.cache import LRUCache
+from app.config import CATEGORY_MODEL_CACHE_SIZE
+from app.matcher import normalize
+
+
+def amount_bucket(amount: int) -> int:
+    """Power of two bucket of an amount in cents, so similar amounts share a feature"""
+    return abs(amount).bit_length()
+
+
+def _best(counts: Counter) -> tuple[UUID | None, float]:
+    total = counts.total()
+    if total <= 0:
+        return None, 0.0
+    category_id, count = counts.most_common(1)[0]
+    return category_id, count / total
+
+
+def _adjust(table: dict, key, category_id: UUID, count: int):
+    counts = table.get(key)
+    if counts is None:
+        counts = table[key] = Counter()
+    counts[category_id] += count
+    if counts[category_id] <= 0:
+        del counts[category_id]
+        if not counts:
+            del table[key]
+
+
+class CategoryModel:
+    """
+    Category frequencies from one user's transactions, keyed by merchant, by
+    merchant and amount bucket, and by merchant name token.
+    """
+
+    __slots__ = ("merchants", "buckets", "tokens", "loaded_at")
+
+    def __init__(self):
+        self.merchants: dict[UUID, Counter] = {}
+        self.buckets: dict[tuple[UUID, int], Counter] = {}
+        self.tokens: dict[str, Counter] = {}
+        self.loaded_at = time.monotonic()
+
+    def add(
+        self,
+        merchant_id: UUID,
+        merchant_name: str,
+        amount: int,
+        category_id: UUID,
+        count: int = 1,
+    ):
+        """Record transactions. A negative count removes them."""
+        _adjust(self.merchants, merchant_id, category_id, count)
+        _adjust(self.buckets, (merchant_id, amount_bucket(amount)), category_id, count)
+        for token in normalize(merchant_name):
+            _adjust(self.tokens, token, category_id, count)
+
+    def suggest(
+        self, merchant_id: UUID | None, amount: int, tokens: tuple[str, ...] = ()
+    ) -> tuple[UUID | None, float]:
+        """
+        Suggest a category and a 0-1 confidence. Transactions with the same merchant
+        in the same amount bucket count double. Merchants the user has never used
+        fall back to the categories of merchants sharing a name token.
+        """
+        counts = self.merchants.get(merchant_id)
+        if counts:
+            counts = counts.copy()
+            counts.update(self.buckets.get((merchant_id, amount_bucket(amount)), ()))
+            return _best(counts)
+
+        counts = Counter()
+        for token in tokens:
+            counts.update(self.tokens.get(token, ()))
+        return _best(counts)
+
+
+category_models = LRUCache(CATEGORY_MODEL_CACHE_SIZE)
@@ -0,0 +1,11 @@
+-- Store amounts as integer cents instead of unbounded decimals.
+-- Sub-cent fractions are rounded half away from zero.
+BEGIN;
+
+ALTER TABLE "transaction"
+    ALTER COLUMN amount TYPE bigint USING round(amount * 100);
+
+ALTER TABLE budget
+    ALTER COLUMN amount TYPE bigint USING round(amount * 100);
+
+COMMIT;
@@ -0,0 +1,11 @@
+-- Directory of users pinned to a shard. Run on every shard, it is only read on
+-- the primary.
+BEGIN;
+
+CREATE TABLE shard_directory(
+    user_id uuid PRIMARY KEY REFERENCES "user" ON DELETE CASCADE,
+    shard integer NOT NULL,
+    moving boolean NOT NULL DEFAULT FALSE
+);
+
+COMMIT;
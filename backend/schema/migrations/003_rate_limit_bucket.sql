@@ -0,0 +1,6 @@
+-- Token buckets of the rate limiter shared across API workers. Run on the primary.
+CREATE UNLOGGED TABLE rate_limit_bucket(
+    key text PRIMARY KEY,
+    tokens double precision NOT NULL,
+    updated timestamptz NOT NULL
+);
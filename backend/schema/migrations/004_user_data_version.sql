@@ -0,0 +1,11 @@
+-- Version of each user's transactions and budgets backing conditional GETs of
+-- their lists. Run on every shard. Users without a row are at version 0.
+BEGIN;
+
+CREATE TABLE user_data_version(
+    user_id uuid PRIMARY KEY REFERENCES "user" ON DELETE CASCADE,
+    version bigint NOT NULL,
+    modified timestamptz NOT NULL
+);
+
+COMMIT;
@@ -0,0 +1,14 @@
+-- Give budgets an effective period so updates keep the previous amounts. Existing
+-- budgets apply to all dates until their next update. Run on every shard.
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE budget ADD COLUMN period daterange NOT NULL DEFAULT daterange(NULL, NULL);
+ALTER TABLE budget ALTER COLUMN period DROP DEFAULT;
+
+ALTER TABLE budget DROP CONSTRAINT budget_category_id_user_id_key;
+ALTER TABLE budget ADD CONSTRAINT budget_period_excl
+    EXCLUDE USING gist (user_id WITH =, category_id WITH =, period WITH &&);
+
+COMMIT;
@@ -0,0 +1,38 @@
+-- Give transactions a content fingerprint with a unique index so re-imported
+-- transactions are skipped. Transactions that are already equal are numbered by
+-- occurrence. Run on every shard.
+BEGIN;
+
+CREATE FUNCTION transaction_fingerprint(
+    user_id uuid, "date" date, amount bigint, merchant_id uuid, occurrence integer
+) RETURNS bytea LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT sha256(convert_to(concat_ws(
+        '|', user_id, to_char("date", 'YYYY-MM-DD'), amount, merchant_id, occurrence
+    ), 'UTF8'))
+$$;
+
+ALTER TABLE "transaction"
+    ADD COLUMN occurrence integer NOT NULL DEFAULT 1 CHECK (occurrence > 0);
+
+UPDATE "transaction" t SET occurrence = numbered.occurrence
+FROM (
+    SELECT id, row_number() OVER (
+        PARTITION BY user_id, "date", amount, merchant_id ORDER BY id
+    ) AS occurrence
+    FROM "transaction"
+) AS numbered
+WHERE numbered.id = t.id AND numbered.occurrence > 1;
+
+ALTER TABLE "transaction" ADD COLUMN fingerprint bytea NOT NULL GENERATED ALWAYS AS (
+    transaction_fingerprint(user_id, "date", amount, merchant_id, occurrence)
+) STORED;
+
+CREATE UNIQUE INDEX transaction_user_fingerprint_idx ON "transaction"(user_id, fingerprint);
+
+CREATE TABLE archived_transaction(
+    user_id uuid NOT NULL REFERENCES "user" ON DELETE CASCADE,
+    fingerprint bytea NOT NULL,
+    PRIMARY KEY (user_id, fingerprint)
+);
+
+COMMIT;
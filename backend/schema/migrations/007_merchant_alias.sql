@@ -0,0 +1,6 @@
+-- Alias patterns matching bank descriptors to merchants. Run on the primary.
+CREATE TABLE IF NOT EXISTS merchant_alias(
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    pattern text UNIQUE NOT NULL,
+    merchant_id uuid NOT NULL REFERENCES merchant ON DELETE CASCADE
+);
@@ -0,0 +1,10 @@
+-- Indexes for merchant search and a user's transactions at a merchant. Run on
+-- every shard. The indexes are built concurrently, so this runs outside a
+-- transaction.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS merchant_name_trgm_idx
+    ON merchant USING gin (name gin_trgm_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS transaction_user_merchant_idx
+    ON "transaction"(user_id, merchant_id);
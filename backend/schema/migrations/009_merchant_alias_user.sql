@@ -0,0 +1,11 @@
+-- Alias patterns belong to the user creating them and only match for that user.
+-- Aliases created before have no user and keep matching for every user. Run on
+-- the primary.
+BEGIN;
+
+ALTER TABLE merchant_alias
+    ADD COLUMN user_id uuid REFERENCES "user" ON DELETE CASCADE,
+    DROP CONSTRAINT merchant_alias_pattern_key,
+    ADD UNIQUE (user_id, pattern);
+
+COMMIT;
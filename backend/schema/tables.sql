@@ -1,3 +1,6 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
 CREATE TABLE "user"(
     id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
     username text UNIQUE NOT NULL,
@@ -16,22 +19,86 @@ CREATE TABLE merchant(
     name text UNIQUE NOT NULL
 );
 
+CREATE INDEX merchant_name_trgm_idx ON merchant USING gin (name gin_trgm_ops);
+
+-- Aliases without a user match for every user
+CREATE TABLE merchant_alias(
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    pattern text NOT NULL,
+    merchant_id uuid NOT NULL REFERENCES merchant ON DELETE CASCADE,
+    user_id uuid REFERENCES "user" ON DELETE CASCADE,
+    UNIQUE (user_id, pattern)
+);
+
+-- Content fingerprint of a transaction. occurrence tells apart transactions with
+-- equal content, such as two equal purchases at a merchant on the same day.
+CREATE FUNCTION transaction_fingerprint(
+    user_id uuid, "date" date, amount bigint, merchant_id uuid, occurrence integer
+) RETURNS bytea LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT sha256(convert_to(concat_ws(
+        '|', user_id, to_char("date", 'YYYY-MM-DD'), amount, merchant_id, occurrence
+    ), 'UTF8'))
+$$;
+
+-- Amounts are integer cents. The fingerprint keeps re-imported transactions out.
 CREATE TABLE "transaction"(
     id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
-    amount decimal NOT NULL,
+    amount bigint NOT NULL,
     "date" date NOT NULL,
     user_id uuid NOT NULL REFERENCES "user",
     merchant_id uuid NOT NULL REFERENCES merchant,
-    category_id uuid NOT NULL REFERENCES category
+    category_id uuid NOT NULL REFERENCES category,
+    occurrence integer NOT NULL DEFAULT 1 CHECK (occurrence > 0),
+    fingerprint bytea NOT NULL GENERATED ALWAYS AS (
+        transaction_fingerprint(user_id, "date", amount, merchant_id, occurrence)
+    ) STORED
 );
 
 CREATE INDEX transaction_user_date_idx ON "transaction"(user_id, "date", id DESC);
 
+CREATE INDEX transaction_user_merchant_idx ON "transaction"(user_id, merchant_id);
+
+CREATE UNIQUE INDEX transaction_user_fingerprint_idx ON "transaction"(user_id, fingerprint);
+
+-- Fingerprints of transactions moved to the archive, so they are not imported again
+CREATE TABLE archived_transaction(
+    user_id uuid NOT NULL REFERENCES "user" ON DELETE CASCADE,
+    fingerprint bytea NOT NULL,
+    PRIMARY KEY (user_id, fingerprint)
+);
+
+-- Budget amounts for the dates of period. The periods of a category never overlap,
+-- and the exclusion constraint's index serves the budget history queries.
 CREATE TABLE budget(
     id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
-    amount decimal NOT NULL,
+    amount bigint NOT NULL,
     category_id uuid NOT NULL REFERENCES category,
     user_id uuid NOT NULL REFERENCES "user",
-    UNIQUE (category_id, user_id)
+    period daterange NOT NULL,
+    CONSTRAINT budget_period_excl EXCLUDE USING gist (user_id WITH =, category_id WITH =, period WITH &&)
+);
+
+
+-- Users pinned to a shard other than their hash ring position, only read on the
+-- primary. moving blocks writes while the user's rows are copied between shards.
+CREATE TABLE shard_directory(
+    user_id uuid PRIMARY KEY REFERENCES "user" ON DELETE CASCADE,
+    shard integer NOT NULL,
+    moving boolean NOT NULL DEFAULT FALSE
+);
+
+-- Rate limiter token buckets shared by the API workers, losing them on a crash
+-- only resets the limits
+CREATE UNLOGGED TABLE rate_limit_bucket(
+    key text PRIMARY KEY,
+    tokens double precision NOT NULL,
+    updated timestamptz NOT NULL
 );
 
+-- Version of each user's transactions and budgets, bumped in every transaction
+-- changing them. Lives on the user's shard.
+CREATE TABLE user_data_version(
+    user_id uuid PRIMARY KEY REFERENCES "user" ON DELETE CASCADE,
+    version bigint NOT NULL,
+    modified timestamptz NOT NULL
+);
@@ -0,0 +1,45 @@
+"""Shared fixtures. Router tests run against the in-memory repositories."""
+import os
+
+import pytest
+
+# Settings app.config requires, set before the app is imported
+for name, value in {
+    "SECRET_KEY": "test",
+    "SQL_HOST": "localhost",
+    "SQL_PORT": "5432",
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "postgres",
+    "POSTGRES_DB": "budgeter",
+}.items():
+    os.environ.setdefault(name, value)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import ratelimit  # noqa: E402
+from app.main import app_factory  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    """Client of an app with an empty in-memory store"""
+    ratelimit._buckets.clear()
+    with TestClient(app_factory("memory")) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def login(client):
+    """Create a user and get headers authenticating as them"""
+
+    def create_user(username: str = "user") -> dict[str, str]:
+        response = client.post(
+            "/api/user/", json={"username": username, "password": "password"}
+        )
+        assert response.status_code == 201
+        response = client.post(
+            "/api/token/", data={"username": username, "password": "password"}
+        )
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return create_user
@@ -0,0 +1,140 @@
+import asyncio
+import datetime
+import uuid
+
+import pyarrow as pa
+import pytest
+
+from app.db import archive
+
+USER_ID = uuid.uuid4()
+MERCHANT_ID = uuid.uuid4()
+CATEGORY_ID = uuid.uuid4()
+DAY = datetime.timedelta(days=1)
+CUTOFF = datetime.date(2024, 1, 11)
+
+
+def make_row(date: datetime.date) -> dict:
+    return {
+        "id": uuid.uuid4(),
+        "amount": 450,
+        "date": date,
+        "user_id": USER_ID,
+        "merchant_id": MERCHANT_ID,
+        "category_id": CATEGORY_ID,
+        "occurrence": 1,
+    }
+
+
+def write_archive(rows: list[dict]):
+    table = pa.table(
+        [
+            pa.array([row["id"].bytes for row in rows], pa.binary(16)),
+            pa.array([row["amount"] for row in rows], pa.int64()),
+            pa.array([row["date"] for row in rows], pa.date32()),
+            pa.array([row["merchant_id"].bytes for row in rows], pa.binary(16)),
+            pa.array([row["category_id"].bytes for row in rows], pa.binary(16)),
+            pa.array([row["occurrence"] for row in rows], pa.int32()),
+        ],
+        schema=archive.SCHEMA,
+    )
+    archive._write(archive._path(USER_ID), table)
+
+
+def newest_first(rows: list[dict]) -> list[dict]:
+    return sorted(rows, key=lambda row: (row["date"], row["id"]), reverse=True)
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path))
+    monkeypatch.setattr(archive, "ARCHIVE_BATCH_ROWS", 3)
+    archive._archive_info.clear()
+    yield tmp_path
+    archive._archive_info.clear()
+
+
+@pytest.fixture
+def history():
+    """Ten archived rows dated before CUTOFF, in four batches, and five hot rows"""
+    archived = [make_row(CUTOFF - DAY * days) for days in range(1, 11)]
+    hot = newest_first([make_row(CUTOFF + DAY * days) for days in range(5)])
+    write_archive(archived)
+    return hot, newest_first(archived)
+
+
+def page(hot, prev_date, limit):
+    rows = [row for row in hot if prev_date is None or row["date"] < prev_date]
+    return asyncio.run(
+        archive.merge_archived(USER_ID, rows[:limit], prev_date, None, limit)
+    )
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 5, 7, 15, 20])
+def test_pages_cross_from_hot_rows_into_archive(history, limit):
+    hot, archived = history
+    rows, prev_date = [], None
+    while True:
+        rows_page = page(hot, prev_date, limit)
+        rows.extend(rows_page)
+        if len(rows_page) < limit:
+            break
+        prev_date = rows_page[-1]["date"]
+
+    assert rows == hot + archived
+
+
+def test_full_page_of_newer_hot_rows_skips_archive(history, monkeypatch):
+    hot, _ = history
+
+    def fail(*args):
+        raise AssertionError("archive was read")
+
+    monkeypatch.setattr(archive, "_read", fail)
+    assert page(hot, None, 5) == hot
+
+
+def test_rows_in_both_places_are_listed_once(history):
+    hot, archived = history
+    hot = hot + archived[:2]
+    assert page(hot, None, 10) == (hot + archived[2:])[:10]
+
+
+def test_without_archive_rows_are_unchanged():
+    rows = [make_row(CUTOFF)]
+    assert asyncio.run(archive.merge_archived(USER_ID, rows, None, None, 5)) == rows
+
+
+def test_read_stops_before_rows_older_than_reaches(history):
+    _, archived = history
+    path = archive._path(USER_ID)
+
+    assert archive._read(path, USER_ID, None, None, 5, CUTOFF) == []
+    rows = archive._read(path, USER_ID, None, None, 5, archived[1]["date"])
+    assert rows == archived[:3]
+
+
+def test_read_skips_batches_newer_than_prev_date(history):
+    _, archived = history
+    rows = archive._read(
+        archive._path(USER_ID), USER_ID, archived[6]["date"], None, 10, None
+    )
+    assert rows == archived[7:]
+
+
+def test_newest_follows_rewritten_file(history):
+    _, archived = history
+    assert asyncio.run(archive._newest(USER_ID)) == archived[0]["date"]
+
+    newer = make_row(CUTOFF)
+    write_archive(archived + [newer])
+    assert asyncio.run(archive._newest(USER_ID)) == CUTOFF
+
+
+def test_spending_sums_archived_rows_by_month(history):
+    months, category_ids, amounts = asyncio.run(
+        archive.archived_spending(USER_ID, datetime.date(2024, 1, 1), CUTOFF)
+    )
+    assert months == [datetime.date(2024, 1, 1)]
+    assert category_ids == [CATEGORY_ID]
+    assert amounts == [450 * 10]
@@ -0,0 +1,129 @@
+import datetime
+import uuid
+
+import fastapi
+import pytest
+
+from app.conditional import not_modified
+
+USER_ID = uuid.uuid4()
+UTC = datetime.timezone.utc
+# 12:00:00.300 rounds up to the Last-Modified date 12:00:01
+MODIFIED = datetime.datetime(2024, 1, 1, 12, 0, 0, 300000, tzinfo=UTC)
+LAST_MODIFIED = "Mon, 01 Jan 2024 12:00:01 GMT"
+
+
+def make_request(**headers: str) -> fastapi.Request:
+    return fastapi.Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "headers": [
+                (name.replace("_", "-").encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        }
+    )
+
+
+def check(version: int = 1, modified=MODIFIED, **headers: str):
+    response = fastapi.Response()
+    cached = not_modified(make_request(**headers), response, USER_ID, version, modified)
+    return cached, response.headers
+
+
+def test_sets_validators():
+    cached, headers = check()
+    assert cached is None
+    assert headers["ETag"] == f'W/"{USER_ID}.1"'
+    assert headers["Last-Modified"] == LAST_MODIFIED
+    assert headers["Cache-Control"] == "private, no-cache"
+    assert headers["Vary"] == "Authorization"
+
+
+@pytest.mark.parametrize(
+    "if_none_match",
+    [f'W/"{USER_ID}.1"', f'"{USER_ID}.1"', f'"other", W/"{USER_ID}.1"', "*"],
+)
+def test_matching_etag_is_not_modified(if_none_match):
+    cached, _ = check(if_none_match=if_none_match)
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == f'W/"{USER_ID}.1"'
+
+
+def test_changed_version_is_modified():
+    cached, _ = check(version=2, if_none_match=f'W/"{USER_ID}.1"')
+    assert cached is None
+
+
+def test_if_none_match_takes_precedence():
+    cached, _ = check(
+        version=2, if_none_match=f'W/"{USER_ID}.1"', if_modified_since=LAST_MODIFIED
+    )
+    assert cached is None
+
+
+def test_if_modified_since_last_modified_is_not_modified():
+    cached, _ = check(if_modified_since=LAST_MODIFIED)
+    assert cached.status_code == 304
+
+
+def test_change_within_the_same_second_is_modified():
+    # The first change was at 12:00:00.300 and a client fetched it at 12:00:00.500
+    # with the date 12:00:00, another change followed at 12:00:00.800
+    modified = MODIFIED.replace(microsecond=800000)
+    cached, _ = check(
+        modified=modified, if_modified_since="Mon, 01 Jan 2024 12:00:00 GMT"
+    )
+    assert cached is None
+
+    later = MODIFIED + datetime.timedelta(seconds=1)
+    cached, _ = check(modified=later, if_modified_since=LAST_MODIFIED)
+    assert cached is None
+
+
+def test_last_modified_is_not_sent_within_its_second():
+    modified = datetime.datetime.now(UTC) + datetime.timedelta(milliseconds=500)
+    cached, headers = check(modified=modified)
+    assert cached is None
+    assert "Last-Modified" not in headers
+    assert "ETag" in headers
+
+
+@pytest.mark.parametrize("if_modified_since", ["yesterday", ""])
+def test_invalid_if_modified_since_is_modified(if_modified_since):
+    cached, _ = check(if_modified_since=if_modified_since)
+    assert cached is None
+
+
+def test_list_without_changes_has_no_last_modified():
+    cached, headers = check(version=0, modified=None, if_modified_since=LAST_MODIFIED)
+    assert cached is None
+    assert "Last-Modified" not in headers
+
+
+def test_transaction_list_is_revalidated(client, login):
+    headers = login()
+    response = client.get("/api/transactions/", headers=headers)
+    etag = response.headers["ETag"]
+
+    response = client.get(
+        "/api/transactions/", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    category = client.post("/api/categories/", json={"name": "Food"}, headers=headers)
+    merchant = client.post("/api/merchants/", json={"name": "Cafe"}, headers=headers)
+    transaction = {
+        "amount": "4.50",
+        "date": "2024-01-01",
+        "merchant_id": merchant.json()["id"],
+        "category_id": category.json()["id"],
+    }
+    client.post("/api/transactions/", json=transaction, headers=headers)
+    response = client.get(
+        "/api/transactions/", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.json()) == 1
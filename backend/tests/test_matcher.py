@@ -0,0 +1,126 @@
+import uuid
+
+from app.matcher import MerchantMatcher, normalize
+
+BLUE_BOTTLE = uuid.uuid4()
+BLUE_BOTTLE_CAFE = uuid.uuid4()
+GREEN_BOTTLE = uuid.uuid4()
+
+
+def make_matcher() -> MerchantMatcher:
+    matcher = MerchantMatcher()
+    matcher.load(
+        [
+            (BLUE_BOTTLE, "Blue Bottle"),
+            (BLUE_BOTTLE_CAFE, "Blue Bottle Cafe"),
+            (GREEN_BOTTLE, "Green Bottle"),
+        ],
+        [],
+    )
+    return matcher
+
+
+def test_normalize_drops_punctuation_and_tokens_with_digits():
+    assert normalize("SQ *BLUE BOTTLE 1234") == ("SQ", "BLUE", "BOTTLE")
+    assert normalize("blue-bottle #12a") == ("BLUE", "BOTTLE")
+
+
+def test_match_finds_longest_pattern():
+    matcher = make_matcher()
+    assert matcher.match("SQ *BLUE BOTTLE 1234") == BLUE_BOTTLE
+    assert matcher.match("BLUE BOTTLE CAFE OAKLAND") == BLUE_BOTTLE_CAFE
+    assert matcher.match("GREEN BOTTLE") == GREEN_BOTTLE
+    assert matcher.match("RED BOTTLE") is None
+
+
+def test_alias_matches_merchant():
+    matcher = make_matcher()
+    matcher.add_alias(GREEN_BOTTLE, "GB")
+    assert matcher.match_many(["GB 0042", "BLUE BOTTLE"]) == [
+        GREEN_BOTTLE,
+        BLUE_BOTTLE,
+    ]
+
+
+def test_shared_pattern_is_kept_until_every_merchant_is_removed():
+    matcher = make_matcher()
+    matcher.add_alias(GREEN_BOTTLE, "Blue Bottle")
+    assert matcher.match("BLUE BOTTLE") == BLUE_BOTTLE
+
+    matcher.remove(BLUE_BOTTLE)
+    assert matcher.match("BLUE BOTTLE") == GREEN_BOTTLE
+
+    matcher.remove(GREEN_BOTTLE)
+    assert matcher.match("BLUE BOTTLE") is None
+    assert matcher.match("BLUE BOTTLE CAFE") == BLUE_BOTTLE_CAFE
+
+
+def test_name_and_alias_of_one_merchant_share_a_pattern():
+    matcher = make_matcher()
+    matcher.add_alias(BLUE_BOTTLE, "blue bottle")
+    matcher.set_name(BLUE_BOTTLE, "Blue Bottle Coffee")
+    assert matcher.match("BLUE BOTTLE") == BLUE_BOTTLE
+    assert matcher.match("BLUE BOTTLE COFFEE") == BLUE_BOTTLE
+
+
+def test_remove_prunes_merchant():
+    matcher = make_matcher()
+    matcher.add_alias(BLUE_BOTTLE_CAFE, "BBC")
+    assert matcher.match("BLUE BOTTLE CAFE") == BLUE_BOTTLE_CAFE
+
+    matcher.remove(BLUE_BOTTLE_CAFE)
+    assert matcher.match("BLUE BOTTLE CAFE") == BLUE_BOTTLE
+    assert matcher.match("BBC") is None
+    assert matcher.name_tokens(BLUE_BOTTLE_CAFE) == ()
+
+
+def test_rename_replaces_name_pattern():
+    matcher = make_matcher()
+    assert matcher.match("GREEN BOTTLE") == GREEN_BOTTLE
+
+    matcher.set_name(GREEN_BOTTLE, "Green Cup")
+    assert matcher.match("GREEN BOTTLE") is None
+    assert matcher.match("GREEN CUP") == GREEN_BOTTLE
+
+
+def test_load_discards_memoized_matches():
+    matcher = make_matcher()
+    assert matcher.match("BLUE BOTTLE") == BLUE_BOTTLE
+
+    matcher.load([], [])
+    assert matcher.match("BLUE BOTTLE") is None
+
+
+def test_user_alias_only_matches_for_that_user():
+    user_id, other_user_id = uuid.uuid4(), uuid.uuid4()
+    matcher = make_matcher()
+    matcher.add_alias(GREEN_BOTTLE, "GB", user_id)
+
+    assert matcher.match("GB 0042", user_id) == GREEN_BOTTLE
+    assert matcher.match("GB 0042", other_user_id) is None
+    assert matcher.match("GB 0042") is None
+
+
+def test_user_alias_wins_tie_with_shared_pattern():
+    user_id = uuid.uuid4()
+    matcher = make_matcher()
+    matcher.add_alias(GREEN_BOTTLE, "Blue Bottle", user_id)
+
+    assert matcher.match("BLUE BOTTLE", user_id) == GREEN_BOTTLE
+    assert matcher.match("BLUE BOTTLE CAFE", user_id) == BLUE_BOTTLE_CAFE
+    assert matcher.match("BLUE BOTTLE") == BLUE_BOTTLE
+
+
+def test_load_keeps_user_aliases_apart():
+    user_id = uuid.uuid4()
+    matcher = MerchantMatcher()
+    matcher.load(
+        [(BLUE_BOTTLE, "Blue Bottle")],
+        [(BLUE_BOTTLE, "BB", None), (GREEN_BOTTLE, "GB", user_id)],
+    )
+    assert matcher.match("BB") == BLUE_BOTTLE
+    assert matcher.match("GB", user_id) == GREEN_BOTTLE
+    assert matcher.match("GB") is None
+
+    matcher.remove(GREEN_BOTTLE)
+    assert matcher.match("GB", user_id) is None
@@ -0,0 +1,35 @@
+def test_alias_only_matches_for_its_user(client, login):
+    alice, bob = login("alice"), login("bob")
+    merchant = client.post(
+        "/api/merchants/", json={"name": "Blue Bottle"}, headers=alice
+    ).json()
+
+    response = client.post(
+        f"/api/merchants/{merchant['id']}/aliases",
+        json={"pattern": "BB"},
+        headers=alice,
+    )
+    assert response.status_code == 201
+    assert response.json()["merchant_id"] == merchant["id"]
+
+    descriptors = {"descriptors": ["BB 0042", "SQ *BLUE BOTTLE"]}
+    response = client.post("/api/merchants/match", json=descriptors, headers=alice)
+    assert [match["merchant_id"] for match in response.json()] == [merchant["id"]] * 2
+
+    response = client.post("/api/merchants/match", json=descriptors, headers=bob)
+    assert [match["merchant_id"] for match in response.json()] == [
+        None,
+        merchant["id"],
+    ]
+
+
+def test_alias_pattern_is_unique_per_user(client, login):
+    alice, bob = login("alice"), login("bob")
+    merchant = client.post(
+        "/api/merchants/", json={"name": "Blue Bottle"}, headers=alice
+    ).json()
+    url = f"/api/merchants/{merchant['id']}/aliases"
+
+    assert client.post(url, json={"pattern": "BB"}, headers=alice).status_code == 201
+    assert client.post(url, json={"pattern": "BB"}, headers=alice).status_code == 409
+    assert client.post(url, json={"pattern": "BB"}, headers=bob).status_code == 201
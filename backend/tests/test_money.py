@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+import pytest
+from pydantic import BaseModel, ValidationError
+
+from app.money import MoneyIn, format_cents, parse_cents
+
+
+class Amount(BaseModel):
+    amount: MoneyIn
+
+
+@pytest.mark.parametrize(
+    "value, cents",
+    [
+        ("12.34", 1234),
+        ("12.3", 1230),
+        ("12", 1200),
+        (".5", 50),
+        (" 7.00 ", 700),
+        ("-0.01", -1),
+        ("+3", 300),
+        (12, 1200),
+        (-12, -1200),
+        (12.34, 1234),
+        (0.1, 10),
+        (Decimal("12.34"), 1234),
+        (Decimal("-1.50"), -150),
+        ("92233720368547758.07", 2**63 - 1),
+        ("-92233720368547758.08", -(2**63)),
+    ],
+)
+def test_parse_cents(value, cents):
+    assert parse_cents(value) == cents
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "--1",
+        "+-1",
+        "-+1",
+        "1.234",
+        "1.2.3",
+        "",
+        "-",
+        ".",
+        "abc",
+        "1e3",
+        "١٢",
+        True,
+        None,
+        [1],
+        12.345,
+        float("nan"),
+        float("inf"),
+        Decimal("NaN"),
+        Decimal("-Infinity"),
+        Decimal("0.001"),
+        "92233720368547758.08",
+        "-92233720368547758.09",
+        2**62,
+    ],
+)
+def test_parse_cents_rejects(value):
+    with pytest.raises(ValueError):
+        parse_cents(value)
+
+
+@pytest.mark.parametrize(
+    "cents, text",
+    [(1234, "12.34"), (5, "0.05"), (-5, "-0.05"), (0, "0.00"), (-1200, "-12.00")],
+)
+def test_format_cents(cents, text):
+    assert format_cents(cents) == text
+
+
+def test_model_parses_and_serializes_amount():
+    assert Amount(amount="4.50").amount == 450
+    assert Amount(amount="4.50").model_dump_json() == '{"amount":"4.50"}'
+    with pytest.raises(ValidationError):
+        Amount(amount="4.505")
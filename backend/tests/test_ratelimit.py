@@ -0,0 +1,65 @@
+import pytest
+
+from app import ratelimit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    ratelimit._buckets.clear()
+    yield clock
+    ratelimit._buckets.clear()
+
+
+def test_burst_up_to_capacity(clock):
+    assert [ratelimit._acquire_local("key", 3, 0.5) for _ in range(3)] == [0.0] * 3
+    assert ratelimit._acquire_local("key", 3, 0.5) == pytest.approx(2.0)
+
+
+def test_tokens_refill_at_rate(clock):
+    for _ in range(3):
+        ratelimit._acquire_local("key", 3, 0.5)
+
+    clock.now += 1
+    assert ratelimit._acquire_local("key", 3, 0.5) == pytest.approx(1.0)
+    clock.now += 1
+    assert ratelimit._acquire_local("key", 3, 0.5) == 0.0
+    assert ratelimit._acquire_local("key", 3, 0.5) == pytest.approx(2.0)
+
+
+def test_refill_stops_at_capacity(clock):
+    ratelimit._acquire_local("key", 3, 0.5)
+    clock.now += 3600
+    assert [ratelimit._acquire_local("key", 3, 0.5) for _ in range(3)] == [0.0] * 3
+    assert ratelimit._acquire_local("key", 3, 0.5) > 0
+
+
+def test_keys_have_separate_buckets(clock):
+    ratelimit._acquire_local("a", 1, 0.1)
+    assert ratelimit._acquire_local("a", 1, 0.1) > 0
+    assert ratelimit._acquire_local("b", 1, 0.1) == 0.0
+
+
+def test_route_is_limited_per_username(client):
+    def sign_in(username: str):
+        return client.post(
+            "/api/token/", data={"username": username, "password": "password"}
+        )
+
+    capacity, _ = ratelimit.RATE_LIMITS["POST /api/token/"]["username"]
+    for _ in range(capacity):
+        assert sign_in("alice").status_code == 401
+
+    response = sign_in("Alice")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert sign_in("bob").status_code == 401
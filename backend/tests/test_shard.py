@@ -0,0 +1,40 @@
+import uuid
+from collections import Counter
+
+import pytest
+
+from app.db.shard import HashRing
+
+USER_IDS = [uuid.UUID(int=index * 7919 + 1) for index in range(4000)]
+
+
+def test_shard_for_is_deterministic():
+    ring, same_ring = HashRing(4), HashRing(4)
+    assert [ring.shard_for(user_id) for user_id in USER_IDS] == [
+        same_ring.shard_for(user_id) for user_id in USER_IDS
+    ]
+
+
+def test_single_shard_takes_every_user():
+    ring = HashRing(1)
+    assert {ring.shard_for(user_id) for user_id in USER_IDS} == {0}
+
+
+def test_users_spread_across_shards():
+    ring = HashRing(4)
+    counts = Counter(ring.shard_for(user_id) for user_id in USER_IDS)
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > len(USER_IDS) / 4 * 0.7
+
+
+@pytest.mark.parametrize("shard_count", [1, 2, 4, 7])
+def test_adding_a_shard_only_moves_users_to_it(shard_count):
+    ring, grown_ring = HashRing(shard_count), HashRing(shard_count + 1)
+    moved = [
+        user_id
+        for user_id in USER_IDS
+        if ring.shard_for(user_id) != grown_ring.shard_for(user_id)
+    ]
+
+    assert {grown_ring.shard_for(user_id) for user_id in moved} == {shard_count}
+    assert len(moved) < len(USER_IDS) / (shard_count + 1) * 1.3
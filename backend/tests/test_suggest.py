@@ -0,0 +1,108 @@
+import uuid
+
+import pytest
+
+from app.suggest import CategoryModel, amount_bucket
+
+FOOD = uuid.uuid4()
+FUN = uuid.uuid4()
+BLUE_BOTTLE = uuid.uuid4()
+GREEN_BOTTLE = uuid.uuid4()
+
+
+def test_amount_bucket_groups_similar_amounts():
+    assert amount_bucket(450) == amount_bucket(500)
+    assert amount_bucket(-450) == amount_bucket(450)
+    assert amount_bucket(450) != amount_bucket(5000)
+
+
+def test_suggest_most_common_category_of_merchant():
+    model = CategoryModel()
+    model.add(BLUE_BOTTLE, "Blue Bottle", 450, FOOD, count=3)
+    model.add(BLUE_BOTTLE, "Blue Bottle", 450, FUN)
+
+    category_id, confidence = model.suggest(BLUE_BOTTLE, 450)
+    assert category_id == FOOD
+    assert confidence == pytest.approx(6 / 8)
+
+
+def test_same_amount_bucket_counts_double():
+    model = CategoryModel()
+    model.add(BLUE_BOTTLE, "Blue Bottle", 450, FOOD, count=2)
+    model.add(BLUE_BOTTLE, "Blue Bottle", 5000, FUN, count=3)
+
+    assert model.suggest(BLUE_BOTTLE, 450)[0] == FOOD
+    assert model.suggest(BLUE_BOTTLE, 5000)[0] == FUN
+
+
+def test_unused_merchant_falls_back_to_name_tokens():
+    model = CategoryModel()
+    model.add(BLUE_BOTTLE, "Blue Bottle", 450, FOOD)
+
+    assert model.suggest(GREEN_BOTTLE, 450, ("GREEN", "BOTTLE")) == (FOOD, 1.0)
+    assert model.suggest(GREEN_BOTTLE, 450, ("GREEN", "CUP")) == (None, 0.0)
+    assert model.suggest(None, 450) == (None, 0.0)
+
+
+def test_negative_count_removes_transactions():
+    model = CategoryModel()
+    model.add(BLUE_BOTTLE, "Blue Bottle", 450, FOOD)
+    model.add(BLUE_BOTTLE, "Blue Bottle", 450, FOOD, count=-1)
+
+    assert model.suggest(BLUE_BOTTLE, 450, ("BLUE",)) == (None, 0.0)
+    assert not model.merchants and not model.buckets and not model.tokens
+
+
+def test_suggest_route_uses_history(client, login):
+    headers = login()
+    merchant = client.post(
+        "/api/merchants/", json={"name": "Blue Bottle"}, headers=headers
+    ).json()
+    food = client.post("/api/categories/", json={"name": "Food"}, headers=headers)
+    food_id = food.json()["id"]
+    for date in ("2024-01-01", "2024-01-02"):
+        transaction = {
+            "amount": "4.50",
+            "date": date,
+            "merchant_id": merchant["id"],
+            "category_id": food_id,
+        }
+        client.post("/api/transactions/", json=transaction, headers=headers)
+
+    response = client.post(
+        "/api/transactions/suggest",
+        json=[
+            {"amount": "4.75", "merchant_id": merchant["id"]},
+            {"amount": "4.75", "descriptor": "SQ *BLUE BOTTLE 0042"},
+            {"amount": "4.75", "descriptor": "UNKNOWN"},
+        ],
+        headers=headers,
+    )
+    assert response.json() == [
+        {"category_id": food_id, "confidence": 1.0},
+        {"category_id": food_id, "confidence": 1.0},
+        {"category_id": None, "confidence": 0.0},
+    ]
+
+
+def test_missing_category_is_filled_in_when_confident(client, login):
+    headers = login()
+    merchant = client.post(
+        "/api/merchants/", json={"name": "Blue Bottle"}, headers=headers
+    ).json()
+    food = client.post("/api/categories/", json={"name": "Food"}, headers=headers)
+    transaction = {
+        "amount": "4.50",
+        "date": "2024-01-01",
+        "merchant_id": merchant["id"],
+    }
+
+    response = client.post("/api/transactions/", json=transaction, headers=headers)
+    assert response.status_code == 422
+
+    transaction["category_id"] = food.json()["id"]
+    client.post("/api/transactions/", json=transaction, headers=headers)
+    transaction.update(category_id=None, date="2024-01-02")
+    response = client.post("/api/transactions/", json=transaction, headers=headers)
+    assert response.status_code == 201
+    assert response.json()["category_id"] == food.json()["id"]
@@ -0,0 +1,114 @@
+import pytest
+
+
+@pytest.fixture
+def setup(client, login):
+    """Headers of a user, a merchant and a category"""
+    headers = login()
+    merchant = client.post(
+        "/api/merchants/", json={"name": "Blue Bottle"}, headers=headers
+    ).json()
+    category = client.post(
+        "/api/categories/", json={"name": "Food"}, headers=headers
+    ).json()
+    return headers, merchant["id"], category["id"]
+
+
+def make_rows(merchant_id, category_id, *dates_and_amounts):
+    return [
+        {
+            "amount": amount,
+            "date": date,
+            "merchant_id": merchant_id,
+            "category_id": category_id,
+        }
+        for date, amount in dates_and_amounts
+    ]
+
+
+def test_equal_rows_are_numbered_in_order(client, setup):
+    headers, merchant_id, category_id = setup
+    rows = make_rows(
+        merchant_id,
+        category_id,
+        ("2024-01-01", "4.50"),
+        ("2024-01-01", "4.50"),
+        ("2024-01-01", "5.00"),
+        ("2024-01-02", "4.50"),
+        ("2024-01-01", "4.50"),
+    )
+
+    response = client.post("/api/transactions/import", json=rows, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert [row["occurrence"] for row in body["created"]] == [1, 2, 1, 1, 3]
+    assert body["skipped"] == []
+
+
+def test_overlapping_statement_only_imports_new_rows(client, setup):
+    headers, merchant_id, category_id = setup
+    first = make_rows(
+        merchant_id,
+        category_id,
+        ("2024-01-01", "4.50"),
+        ("2024-01-01", "4.50"),
+        ("2024-01-02", "3.00"),
+    )
+    client.post("/api/transactions/import", json=first, headers=headers)
+
+    second = make_rows(
+        merchant_id,
+        category_id,
+        ("2024-01-01", "4.50"),
+        ("2024-01-01", "4.50"),
+        ("2024-01-01", "4.50"),
+        ("2024-01-02", "3.00"),
+        ("2024-01-03", "3.00"),
+    )
+    body = client.post("/api/transactions/import", json=second, headers=headers).json()
+    assert body["skipped"] == [0, 1, 3]
+    assert [(row["date"], row["occurrence"]) for row in body["created"]] == [
+        ("2024-01-01", 3),
+        ("2024-01-03", 1),
+    ]
+    assert len(client.get("/api/transactions/", headers=headers).json()) == 5
+
+
+def test_given_occurrence_is_kept(client, setup):
+    headers, merchant_id, category_id = setup
+    rows = make_rows(
+        merchant_id, category_id, ("2024-01-01", "4.50"), ("2024-01-01", "4.50")
+    )
+    rows[0]["occurrence"] = 2
+
+    body = client.post("/api/transactions/import", json=rows, headers=headers).json()
+    assert [row["occurrence"] for row in body["created"]] == [2, 1]
+
+
+def test_repeated_row_in_one_import_is_skipped(client, setup):
+    headers, merchant_id, category_id = setup
+    rows = make_rows(
+        merchant_id, category_id, ("2024-01-01", "4.50"), ("2024-01-01", "4.50")
+    )
+    for row in rows:
+        row["occurrence"] = 1
+
+    body = client.post("/api/transactions/import", json=rows, headers=headers).json()
+    assert len(body["created"]) == 1
+    assert body["skipped"] == [1]
+
+
+def test_create_rejects_duplicate(client, setup):
+    headers, merchant_id, category_id = setup
+    (row,) = make_rows(merchant_id, category_id, ("2024-01-01", "4.50"))
+
+    assert (
+        client.post("/api/transactions/", json=row, headers=headers).status_code == 201
+    )
+    assert (
+        client.post("/api/transactions/", json=row, headers=headers).status_code == 409
+    )
+    row["occurrence"] = 2
+    assert (
+        client.post("/api/transactions/", json=row, headers=headers).status_code == 201
+    )